@@ -31,8 +31,7 @@ def main():
 
     with s.auto_advance():
         print("Typing {} characters".format(len(EARNESTNESS)))
-        for line in EARNESTNESS.splitlines():
-            s.enter(line)
+        s.enter_stream(EARNESTNESS)
 
     s.send_keys(oraide.keys.escape, literal=False)
     s.enter(':q!')
@@ -1,21 +1,34 @@
 """'A library to help presenters demonstrate terminal sessions hands-free."""
 
+import codecs
 import locale
 import logging
+import os
 import random
 import subprocess
+import threading
 import time
+import unicodedata
 import warnings
+import weakref
 from contextlib import contextmanager
 from functools import wraps
 
 from . import keys as keyboard
 from .version import get_version
 
+try:
+    import contextvars
+except ImportError:  # Python < 3.7
+    contextvars = None
+
 __version__ = get_version()
 
 logger = logging.getLogger(__name__)
 
+# the encoding of tmux's output, looked up once rather than on every error
+_encoding = locale.getdefaultlocale()[1] or 'utf-8'
+
 # check for minimum tmux version
 VALID_VERSIONS = ['1.7', '1.8', '1.9']
 WRONG_VERSION_MESSAGE = ('tmux {ver} or greater not found. '
@@ -23,13 +36,20 @@ WRONG_VERSION_MESSAGE = ('tmux {ver} or greater not found. '
                          ).format(ver=VALID_VERSIONS[0])
 try:
     output = subprocess.check_output(['tmux', '-V'], stderr=subprocess.STDOUT)
-    output = output.decode(locale.getdefaultlocale()[1])
+    output = output.decode(_encoding)
     version_checks = (ver in output for ver in VALID_VERSIONS)
     if not any(version_checks):
         warnings.warn(WRONG_VERSION_MESSAGE, Warning)
 except Exception as exc:
     warnings.warn(WRONG_VERSION_MESSAGE, Warning)
 
+# error messages, as worded by various versions of tmux
+SESSION_NOT_FOUND_MESSAGES = ['session not found', "can't find session",
+                              "can't find pane"]
+CONNECTION_FAILED_MESSAGES = ['failed to connect to server',
+                              'no server running', 'error connecting to',
+                              'server exited unexpectedly']
+
 
 class TmuxError(subprocess.CalledProcessError):
     """The command sent to tmux returned a non-zero exit status. This is an
@@ -49,6 +69,25 @@ class ConnectionFailedError(TmuxError):
         return 'Connection to tmux server failed.'
 
 
+class CircuitOpenError(ConnectionFailedError):
+    """The command was not sent, because recent connections to the tmux server
+    failed and the server's circuit breaker is open (see
+    :class:`ServerHealth`).
+
+    This exception type adds another attribute, ``health``, the
+    :class:`ServerHealth` of the server.
+    """
+    def __init__(self, *args, **kwargs):
+        self.health = kwargs.pop('health', None)
+        super(CircuitOpenError, self).__init__(*args, **kwargs)
+
+    def __str__(self):
+        if self.health is None:
+            return 'tmux server unreachable; not retrying yet.'
+        return ('tmux server unreachable; not retrying for {:.1f} '
+                'seconds.').format(self.health.retry_in)
+
+
 class SessionNotFoundError(TmuxError):
     """The tmux session was not found (but a connection to tmux server was
     established).
@@ -64,7 +103,12 @@ class SessionNotFoundError(TmuxError):
         return 'tmux session {} not found.'.format(repr(self.session))
 
 
-def send_keys(session, keys, literal=True):
+class Cancelled(Exception):
+    """The keystrokes being typed were abandoned because
+    :meth:`Session.cancel` was called."""
+
+
+def send_keys(session, keys, literal=True, socket_name=None):
     """Send keys to a tmux session.
     This function is a wrapper around tmux's ``send-keys`` command.
 
@@ -74,9 +118,11 @@ def send_keys(session, keys, literal=True):
     :param session: name of a tmux session
     :param keys: keystrokes to send to the tmux session
     :param literal: whether to prevent tmux from looking up keynames
+    :param socket_name: the name of the tmux server's socket (as with tmux's
+        ``-L`` option), for servers other than the default
     """
 
-    args = ["tmux", "send-keys"]
+    args = _tmux_command(socket_name, "send-keys")
 
     if literal:
         args.append('-l')
@@ -84,36 +130,451 @@ def send_keys(session, keys, literal=True):
     args.append("-t{}".format(session))
     args.append(keys)
 
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('Sending keys with command: %s', ' '.join(args))
+    _tmux(args, session, socket_name)
+    # recorded once sent, so failed sends and retries aren't journaled twice
+    journal = _journal
+    if journal is not None:
+        journal.record(socket_name, session, keys, literal)
+
+
+def capture_pane(session, start=None, end=None, escapes=False,
+                 socket_name=None):
+    """Return the contents of a tmux session's pane as a byte string.
+    This function is a wrapper around tmux's ``capture-pane`` command.
+
+    By default, only the visible part of the pane is captured. Use ``start``
+    and ``end`` to capture a range of lines instead: ``0`` is the first
+    visible line, and negative numbers are lines in the scrollback history.
+
+    :param session: name of a tmux session
+    :param int start: the first line to capture
+    :param int end: the last line to capture
+    :param escapes: whether to include escape sequences for text and
+        background attributes
+    :param socket_name: the name of the tmux server's socket
+    """
+    args = _tmux_command(socket_name, 'capture-pane', '-p')
+
+    if escapes:
+        args.append('-e')
+    if start is not None:
+        args.append('-S{}'.format(start))
+    if end is not None:
+        args.append('-E{}'.format(end))
+
+    args.append('-t{}'.format(session))
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('Capturing pane with command: %s', ' '.join(args))
+    return _tmux(args, session, socket_name)
+
+
+def _tmux_command(socket_name, *args):
+    """Start the argument list of a tmux command."""
+    if socket_name is None:
+        return ['tmux'] + list(args)
+    return ['tmux', '-L', socket_name] + list(args)
+
+
+def _tmux(args, session, socket_name=None, probe=False):
+    """Run a tmux command, translating known failures into exceptions.
+
+    Commands for a server whose circuit is open fail immediately, without
+    starting tmux, unless ``probe`` is true.
+    """
+    health = _servers.get(socket_name)
+    if health is not None and health.tripped and not probe:
+        if not health.allow_probe():
+            raise CircuitOpenError(None, ' '.join(args), b'', health=health)
+
+    client = _control_clients.get(socket_name)
+    reply = _execute(client, args) if client is not None else None
+    if reply is None:
+        proc = _spawn(args)
+        out = _reply(proc)
+        returncode = proc.returncode
+    else:
+        returncode, out = reply
+
+    if not returncode:
+        if health is not None and health.tripped:
+            health.record_success()
+        return out
+
     cmd = ' '.join(args)
+    output = out.decode(_encoding)
+    if any(msg in output for msg in CONNECTION_FAILED_MESSAGES):
+        server_health(socket_name).record_failure()
+        raise ConnectionFailedError(returncode, cmd, out)
+
+    if health is not None and health.tripped:
+        health.record_success()
+    if any(msg in output for msg in SESSION_NOT_FOUND_MESSAGES):
+        raise SessionNotFoundError(returncode, cmd, out, session=session)
+    else:
+        raise subprocess.CalledProcessError(returncode, args, out)
+
+
+# persistent tmux control mode connections, by socket name (see
+# ``oraide.control``)
+_control_clients = {}
+
+# the journal in which sends are recorded, if any (see ``oraide.journal``)
+_journal = None
+
+
+class ServerHealth(object):
+    """A circuit breaker for one tmux server.
+
+    The circuit trips on the first failed connection to the server. While it
+    is tripped, commands for the server raise :exc:`CircuitOpenError`
+    immediately, without starting tmux, except for one probe command after
+    each backoff interval. The interval starts at ``backoff`` seconds and
+    doubles after each failed probe, up to ``max_backoff`` seconds. A
+    successful command resets the circuit.
+
+    Use :func:`server_health` to get the tracker for a server.
 
-    logger.debug('Sending keys with command: %s', cmd)
-    try:
-        subprocess.check_output(args, stderr=subprocess.STDOUT)
-    except subprocess.CalledProcessError as exc:
-        output = exc.output.decode(locale.getdefaultlocale()[1])
-        if 'session not found' in output:
-            raise SessionNotFoundError(exc.returncode, cmd, exc.output,
-                                       session=session)
-        elif 'failed to connect to server' in output:
-            raise ConnectionFailedError(exc.returncode, cmd, exc.output)
+    :param socket_name: the name of the server's socket, or ``None`` for the
+        default server
+    :param backoff: the initial number of seconds between probes
+    :param max_backoff: the longest number of seconds between probes
+    """
+
+    def __init__(self, socket_name=None, backoff=0.5, max_backoff=30.0):
+        self.socket_name = socket_name
+        self.initial_backoff = backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Close the circuit, as after a successful command."""
+        with self._lock:
+            self.tripped = False
+            self.failures = 0
+            self.backoff = self.initial_backoff
+            self.next_probe = None
+
+    def allow_probe(self):
+        """Return whether a command may be sent to test the server. Only one
+        command is allowed per backoff interval."""
+        with self._lock:
+            if not self.tripped:
+                return True
+            now = _clock()
+            if now < self.next_probe:
+                return False
+            self.next_probe = now + self.backoff
+            return True
+
+    def record_failure(self):
+        """Trip the circuit (or keep it tripped), and back off further."""
+        with self._lock:
+            if not self.tripped:
+                logger.warning('tmux server %s is unreachable',
+                               self.socket_name or '(default)')
+            self.tripped = True
+            self.failures += 1
+            self.next_probe = _clock() + self.backoff
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+
+    def record_success(self):
+        """Close the circuit after the server responded."""
+        if self.tripped:
+            logger.warning('tmux server %s is reachable again',
+                           self.socket_name or '(default)')
+        self.reset()
+
+    @property
+    def retry_in(self):
+        """The number of seconds until the next probe is allowed, or ``0``."""
+        if not self.tripped:
+            return 0
+        return max(self.next_probe - _clock(), 0)
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def server_health(socket_name=None):
+    """Return the :class:`ServerHealth` circuit breaker for a tmux server.
+
+    :param socket_name: the name of the server's socket, or ``None`` for the
+        default server
+    """
+    health = _servers.get(socket_name)
+    if health is None:
+        with _servers_lock:
+            health = _servers.setdefault(socket_name,
+                                         ServerHealth(socket_name))
+    return health
+
+
+# These indirections are replaced by ``oraide.profiling`` to time each kind of
+# work without adding overhead when no profiler is installed.
+def _spawn(args):
+    """Start a tmux client process."""
+    return subprocess.Popen(args, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT)
+
+
+def _reply(proc):
+    """Wait for a tmux client process to finish and return its output."""
+    return proc.communicate()[0]
+
+
+def _execute(client, args):
+    """Run a command over a control mode connection (see
+    ``oraide.control``) and return its exit status and output, or ``None``
+    if the connection can't run it."""
+    return client.execute(args)
+
+
+def _sleep(seconds, flow=None):
+    """Sleep for ``seconds``. With a session's ``flow`` (see
+    :class:`_Flow`), the sleep can be paused or cancelled."""
+    if flow is None:
+        time.sleep(seconds)
+    else:
+        flow.wait(seconds)
+
+
+_clock = getattr(time, 'monotonic', time.time)
+
+try:
+    _input = raw_input
+except NameError:
+    _input = input
+
+
+def _iter_text(source, encoding='utf-8', chunk_size=1024):
+    """Lazily iterate over chunks of text from ``source``.
+
+    ``source`` may be a string, a file object (anything with a ``read``
+    method), or any other iterable of strings. Byte strings are decoded
+    incrementally, so a multibyte character split across two chunks is never
+    broken in half.
+
+    :param source: the text, file object, or iterable of strings to read
+    :param encoding: the encoding used to decode byte strings
+    :param int chunk_size: the number of bytes or characters to read from a
+        file object at a time
+    """
+    if isinstance(source, (type(b''), type(u''))):
+        source = [source]
+    elif hasattr(source, 'read'):
+        read = source.read
+        source = iter(lambda: read(chunk_size), read(0))
+
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in source:
+        if isinstance(chunk, type(b'')) and not isinstance(chunk, type(u'')):
+            chunk = decoder.decode(chunk)
+        if chunk:
+            yield chunk
+
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def _iter_lines(source, encoding='utf-8', chunk_size=1024):
+    """Lazily iterate over the lines of ``source``, without line endings.
+
+    Accepts the same kinds of ``source`` as ``_iter_text``. Lines are
+    assembled as chunks arrive, so only the current line is held in memory.
+    """
+    pending = u''
+    for chunk in _iter_text(source, encoding=encoding, chunk_size=chunk_size):
+        lines = (pending + chunk).split(u'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip(u'\r')
+
+    if pending:
+        yield pending.rstrip(u'\r')
+
+
+class _ContextLocal(object):
+    """Per-session values that are local to the current thread or asyncio
+    task. They are stored in one :mod:`contextvars` variable where available,
+    or in thread-local storage otherwise, as a mapping with weak references
+    to the sessions, so that a value never keeps its session alive.
+
+    :meth:`set` returns a token that :meth:`reset` takes to restore the
+    values as they were, as with :meth:`contextvars.ContextVar.reset`."""
+
+    def __init__(self, name):
+        if contextvars is not None:
+            self._var = contextvars.ContextVar(name)
         else:
-            raise
+            self._local = threading.local()
 
+    def get(self, key, default=None):
+        return self._values().get(key, default)
 
-def prompt(func, input_func=None):
-    """Handle prompting for advancement on `Session` methods."""
-    if input_func is None:
+    def set(self, key, value):
+        values = weakref.WeakKeyDictionary(self._values())
+        values[key] = value
+        if contextvars is not None:
+            return self._var.set(values)
+        token, self._local.values = self._values(), values
+        return token
+
+    def reset(self, token):
+        if contextvars is not None:
+            self._var.reset(token)
+        else:
+            self._local.values = token
+
+    def _values(self):
+        if contextvars is not None:
+            return self._var.get({})
+        return getattr(self._local, 'values', {})
+
+
+_auto_advancing = _ContextLocal('oraide_auto_advancing')
+
+
+class _Flow(object):
+    """Whether a session's typing is paused or cancelled. Typing checks it
+    between keystrokes and waits on it instead of sleeping, so a pause or
+    cancellation takes effect at once, from any thread."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.paused = False
+        self.cancelled = False
+        self._typing = 0
+
+    def pause(self):
+        with self._condition:
+            self.paused = True
+            self._condition.notify_all()
+
+    def resume(self):
+        with self._condition:
+            self.paused = False
+            self._condition.notify_all()
+
+    def cancel(self):
+        with self._condition:
+            self.paused = False
+            # there's nothing to cancel between steps
+            if self._typing:
+                self.cancelled = True
+            self._condition.notify_all()
+
+    @contextmanager
+    def typing(self):
+        """Mark a step as in progress, so it can be cancelled."""
+        with self._condition:
+            self._typing += 1
         try:
-            input_func = raw_input
-        except NameError:
-            input_func = input
+            yield
+        finally:
+            with self._condition:
+                self._typing -= 1
+                if not self._typing:
+                    self.cancelled = False
+
+    def check(self):
+        """Wait while paused, and raise :exc:`Cancelled` if cancelled."""
+        if self.paused or self.cancelled:
+            with self._condition:
+                self._check()
+
+    def wait(self, seconds):
+        """Sleep for ``seconds``, not counting time spent paused."""
+        with self._condition:
+            while True:
+                self._check()
+                if seconds <= 0:
+                    return
+                start = _clock()
+                self._condition.wait(seconds)
+                seconds -= _clock() - start
+
+    def _check(self):
+        while self.paused and not self.cancelled:
+            self._condition.wait()
+        if self.cancelled:
+            raise Cancelled()
+
+
+def _joins_previous(char):
+    """Whether ``char`` belongs to the same grapheme cluster as the character
+    before it (a combining mark, variation selector, emoji modifier, or
+    zero-width joiner)."""
+    return (unicodedata.combining(char) or
+            unicodedata.category(char) in ('Mn', 'Me', 'Mc') or
+            u'\ufe00' <= char <= u'\ufe0f' or
+            u'\U0001f3fb' <= char <= u'\U0001f3ff' or
+            char == u'\u200d')
+
+
+def _iter_graphemes(text):
+    """Split ``text`` into approximate grapheme clusters: a base character
+    with any combining marks and modifiers, emoji joined with zero-width
+    joiners, and pairs of regional indicators (flags)."""
+    cluster = u''
+    joining = False
+    for char in text:
+        regional = u'\U0001f1e6' <= char <= u'\U0001f1ff'
+        if cluster and (joining or _joins_previous(char) or
+                        (regional and len(cluster) == 1 and
+                         u'\U0001f1e6' <= cluster <= u'\U0001f1ff')):
+            cluster += char
+        else:
+            if cluster:
+                yield cluster
+            cluster = char
+        joining = char == u'\u200d'
+    if cluster:
+        yield cluster
 
+
+def _iter_whole_graphemes(chunks):
+    """Yield the text of ``chunks`` so that no grapheme cluster is split
+    between two pieces. The last cluster of each chunk is held back and
+    joined to the next chunk, which may begin with a combining mark, a
+    zero-width joiner, or the second half of a flag that belongs to it."""
+    held = u''
+    for chunk in chunks:
+        clusters = list(_iter_graphemes(held + chunk))
+        held = clusters.pop() if clusters else u''
+        if clusters:
+            yield u''.join(clusters)
+    if held:
+        yield held
+
+
+def _iter_bursts(text, size):
+    """Group ``text`` into bursts of at most ``size`` grapheme clusters,
+    ending a burst early after whitespace so bursts follow word boundaries.
+    Yield each burst and the number of clusters in it."""
+    burst = []
+    for cluster in _iter_graphemes(text):
+        burst.append(cluster)
+        if len(burst) >= size or cluster.isspace():
+            yield u''.join(burst), len(burst)
+            burst = []
+    if burst:
+        yield u''.join(burst), len(burst)
+
+
+def prompt(func, input_func=None):
+    """Handle prompting for advancement on `Session` methods."""
     @wraps(func)
     def wrapper(*args, **kwargs):
         self = args[0]
         keys = args[1] if len(args) > 1 else None
 
-        if not args[0].auto_advancing:
+        if not (self.auto_advancing or self.fast_forwarding):
             if keys is not None:
                 msg = "[{session}] Press enter to send {keys}".format(
                     keys=repr(keys),
@@ -123,11 +584,58 @@ def prompt(func, input_func=None):
                 msg = "[{session}] Press enter to continue".format(
                     session=self.session
                 )
-            input_func(msg)
+            (input_func or _input)(msg)
         return func(*args, **kwargs)
     return wrapper
 
 
+class Checkpoints(object):
+    """The numbered checkpoints reached in one run of a script.
+
+    A script that drives several sessions (or panes) reaches its checkpoints
+    in one sequence, whichever session records them, so every session in the
+    run should share one counter: pass the same instance to each
+    :class:`Session` as ``checkpoints``. Sessions that are given neither
+    ``checkpoints`` nor ``resume_from`` share the counter for the
+    ``ORAIDE_RESUME_FROM`` environment variable, if it is set.
+
+    :param int resume_from: the number of the checkpoint from which to resume
+        at normal pace, or ``None`` to run everything at normal pace
+    """
+
+    def __init__(self, resume_from=None):
+        self.resume_from = resume_from
+        self.last = 0
+        self._lock = threading.Lock()
+
+    @property
+    def fast_forwarding(self):
+        """Whether the checkpoint given by ``resume_from`` is still to come."""
+        return self.resume_from is not None and self.last < self.resume_from
+
+    def reach(self):
+        """Record the next checkpoint and return its number."""
+        with self._lock:
+            self.last += 1
+            return self.last
+
+
+# the checkpoints shared by the sessions resumed with ORAIDE_RESUME_FROM
+_run_checkpoints = None
+_run_checkpoints_lock = threading.Lock()
+
+
+def _environment_checkpoints():
+    global _run_checkpoints
+    if not os.environ.get('ORAIDE_RESUME_FROM'):
+        return Checkpoints()
+    with _run_checkpoints_lock:
+        if _run_checkpoints is None:
+            _run_checkpoints = Checkpoints(
+                int(os.environ['ORAIDE_RESUME_FROM']))
+        return _run_checkpoints
+
+
 class Session(object):
     """A session to which to send keys. This function allows for the
     deduplication of session names when repeatedly sending keystrokes the same
@@ -138,13 +646,172 @@ class Session(object):
         immediately, or wait for confirmation, on certain methods
     :param int teletype_delay: the delay between keystrokes for the
         :meth:`teletype` method (for overriding the default of 90 milliseconds)
+    :param int teletype_burst: the largest number of characters
+        :meth:`teletype` sends at once (for overriding the default of 1)
+    :param int resume_from: the number of the checkpoint from which to resume
+        at normal pace; everything before it is fast-forwarded (defaults to
+        the value of the ``ORAIDE_RESUME_FROM`` environment variable, if set,
+        in which case the checkpoints are shared with every other session
+        that uses it)
+    :param checkpoints: the :class:`Checkpoints` of the run, to number
+        checkpoints across several sessions (it can't be combined with
+        ``resume_from``)
+    :param socket_name: the name of the tmux server's socket (as with tmux's
+        ``-L`` option), for servers other than the default
+    :param restart_command: a shell command with which to start the session
+        again if the connection to the tmux server fails (by default, the
+        session is not restarted)
+
+    .. seealso:: :meth:`checkpoint`, :class:`ServerHealth`
     """
 
     def __init__(self, session, enable_auto_advance=False,
-                 teletype_delay=None):
-        self.session = session
-        self.auto_advancing = enable_auto_advance
+                 teletype_delay=None, resume_from=None, socket_name=None,
+                 restart_command=None, teletype_burst=None,
+                 checkpoints=None):
+        self._session = session
+        self.restart_command = restart_command
+        self._socket_name = socket_name
+        self._compile()
+        self.enable_auto_advance = enable_auto_advance
         self.teletype_delay = teletype_delay
+        self.teletype_burst = teletype_burst
+        self._lock = threading.RLock()
+        self._flow = _Flow()
+
+        if checkpoints is not None:
+            if resume_from is not None:
+                raise ValueError(
+                    'resume_from is set by the shared checkpoints')
+        elif resume_from is not None:
+            checkpoints = Checkpoints(resume_from)
+        else:
+            checkpoints = _environment_checkpoints()
+        self.checkpoints = checkpoints
+        self._screens = {}
+
+    @property
+    def session(self):
+        """The name of the tmux session."""
+        return self._session
+
+    @session.setter
+    def session(self, value):
+        self._session = value
+        self._compile()
+
+    @property
+    def socket_name(self):
+        """The name of the tmux server's socket, or ``None`` for the default
+        server."""
+        return self._socket_name
+
+    @socket_name.setter
+    def socket_name(self, value):
+        self._socket_name = value
+        self._compile()
+
+    def _compile(self):
+        # the command for :meth:`send_literal_char`, built once per target
+        # instead of on every keystroke
+        self._literal_argv = _tmux_command(self._socket_name, 'send-keys',
+                                           '-l', '-t{}'.format(self._session))
+
+    @property
+    def auto_advancing(self):
+        """Whether keystrokes are sent without a confirmation prompt. The value
+        is local to the current thread or asyncio task, so :meth:`auto_advance`
+        in one thread doesn't change whether another thread is prompted.
+        Unless changed, it is the ``enable_auto_advance`` setting.
+        """
+        return _auto_advancing.get(self, self.enable_auto_advance)
+
+    @auto_advancing.setter
+    def auto_advancing(self, value):
+        _auto_advancing.set(self, value)
+
+    @property
+    def fast_forwarding(self):
+        """Whether the session is replaying steps before the checkpoint given
+        by ``resume_from``. While fast-forwarding, prompts are skipped and
+        :meth:`teletype` sends its keys all at once, without delay.
+        """
+        return self.checkpoints.fast_forwarding
+
+    @property
+    def resume_from(self):
+        """The number of the checkpoint from which to resume at normal pace,
+        or ``None``."""
+        return self.checkpoints.resume_from
+
+    @property
+    def last_checkpoint(self):
+        """The number of the last checkpoint reached in the run, or ``0``."""
+        return self.checkpoints.last
+
+    def checkpoint(self, label=None):
+        """Record the next numbered checkpoint and return its number.
+
+        Checkpoints are numbered from 1, in the order they are reached. If a
+        long script fails partway through, rerun it with ``resume_from`` (or
+        the ``ORAIDE_RESUME_FROM`` environment variable) set to the number of
+        the last checkpoint reached: the steps before that checkpoint are
+        fast-forwarded and the rest run at normal pace. For example:
+
+        .. code-block:: python
+
+           session = Session('demo', resume_from=2)
+           session.enter('cd project')      # fast-forwarded
+           session.checkpoint('setup')      # checkpoint 1
+           session.enter('make')            # fast-forwarded
+           session.checkpoint('build')      # checkpoint 2
+           session.enter('make test')       # normal pace, with a prompt
+
+        Checkpoints are counted across every session that shares the same
+        :class:`Checkpoints`, so a script driving several panes resumes at the
+        same point in all of them.
+
+        :param label: an optional description of the checkpoint, for logging
+        """
+        number = self.checkpoints.reach()
+        logger.info('[%s] Checkpoint %d%s', self.session, number,
+                    ': {}'.format(label) if label else '')
+        return number
+
+    @property
+    def paused(self):
+        """Whether typing in this session is paused (see :meth:`pause`)."""
+        return self._flow.paused
+
+    def pause(self):
+        """Freeze typing in this session until :meth:`resume` is called.
+
+        :meth:`teletype`, :meth:`enter`, and the other typing methods stop
+        before their next keystroke, even in the middle of the delay between
+        keystrokes, and pick up where they left off when resumed. Call this
+        from another thread (or a signal handler), such as one watching for a
+        key press during questions from the audience.
+        """
+        logger.info('[%s] Paused', self.session)
+        self._flow.pause()
+
+    def resume(self):
+        """Continue typing after :meth:`pause`."""
+        logger.info('[%s] Resumed', self.session)
+        self._flow.resume()
+
+    def cancel(self):
+        """Abandon the keystrokes being typed in this session.
+
+        The typing method in progress raises :exc:`Cancelled` before its next
+        keystroke (even if it is paused), without sending anything more;
+        nothing is interrupted partway through a tmux command, and
+        auto-advance settings are restored as usual. Typing is no longer
+        paused afterward. If nothing is being typed, there is nothing to
+        cancel, and this only ends any pause.
+        """
+        logger.info('[%s] Cancelled', self.session)
+        self._flow.cancel()
 
     def send_keys(self, keys, literal=True):
         """Send each literal character in ``keys`` to the session.
@@ -154,11 +821,137 @@ class Session(object):
 
         .. seealso:: :func:`send_keys`
         """
-        send_keys(self.session, keys, literal=literal)
+        with self._lock:
+            try:
+                send_keys(self.session, keys, literal=literal,
+                          socket_name=self.socket_name)
+            except ConnectionFailedError as exc:
+                if not self._restart(exc):
+                    raise
+                send_keys(self.session, keys, literal=literal,
+                          socket_name=self.socket_name)
+
+    def send_literal_char(self, key):
+        """Send a single literal keystroke (or a short burst of them) to the
+        session.
+
+        This is the fast path used by :meth:`teletype`: the tmux command is
+        prepared when the session is created, so each call does no more work
+        than starting tmux.
+
+        :param key: the literal keystroke to send
+        """
+        args = self._literal_argv + [key]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Sending keys with command: %s', ' '.join(args))
+        with self._lock:
+            try:
+                _tmux(args, self._session, self._socket_name)
+            except ConnectionFailedError as exc:
+                if not self._restart(exc):
+                    raise
+                _tmux(args, self._session, self._socket_name)
+        journal = _journal
+        if journal is not None:
+            journal.record(self._socket_name, self._session, key)
+
+    def _restart(self, exc):
+        """Start the session again with ``restart_command`` after a failed
+        connection, returning whether the restart succeeded."""
+        if self.restart_command is None or isinstance(exc, CircuitOpenError):
+            return False
+
+        logger.warning('[%s] Restarting session: %s', self._session,
+                       self.restart_command)
+        args = _tmux_command(self._socket_name, 'new-session', '-d',
+                             '-s{}'.format(self._session),
+                             self.restart_command)
+        try:
+            _tmux(args, self._session, self._socket_name, probe=True)
+        except subprocess.CalledProcessError:
+            return False
+        return True
+
+    def screen(self, start=None, end=None, escapes=False, full=False):
+        """Return the lines of the session's pane that changed since the
+        previous call, as a list of ``(row, line)`` tuples.
+
+        The first call for a given range returns every line. Later calls
+        compare each row with the previous capture and return only the rows
+        that differ, so monitoring a pane doesn't require decoding or
+        searching all of it each time. Rows that no longer exist (because the
+        capture got shorter) are returned with ``None`` as their line.
+
+        :param int start: the first line to capture (negative numbers are
+            lines in the scrollback history)
+        :param int end: the last line to capture
+        :param escapes: whether to include escape sequences for text and
+            background attributes
+        :param full: whether to return every line, changed or not
+
+        .. seealso:: :func:`capture_pane`
+        """
+        key = (start, end, escapes)
+        with self._lock:
+            output = self._capture(start, end, escapes)
+            return self._diff_screen(key, output, full)
+
+    def _capture(self, start, end, escapes):
+        return capture_pane(self.session, start=start, end=end,
+                            escapes=escapes, socket_name=self.socket_name)
+
+    def _diff_screen(self, key, output, full):
+        rows = output.split(b'\n')
+        if rows and not rows[-1]:
+            rows.pop()
+
+        encoding = _encoding
+        old_hashes, lines = self._screens.get(key, ((), []))
+        hashes = [hash(row) for row in rows]
+
+        changed = []
+        for index, row in enumerate(rows):
+            if index < len(old_hashes) and old_hashes[index] == hashes[index]:
+                continue
+            line = row.decode(encoding)
+            if index < len(lines):
+                lines[index] = line
+            else:
+                lines.append(line)
+            changed.append((index, line))
+
+        for index in range(len(rows), len(lines)):
+            changed.append((index, None))
+        del lines[len(rows):]
+
+        self._screens[key] = (hashes, lines)
+
+        if full:
+            return list(enumerate(lines))
+        return changed
+
+    def output(self, buffer_size=1000, overflow='drop-oldest', history=100,
+               strip_escapes=True):
+        """Return an :class:`~oraide.output.OutputStream`, an iterator of the
+        lines printed in the session from now on. Close the stream (or use it
+        as a context manager) to stop collecting output.
+
+        :param int buffer_size: the largest number of unread lines to keep
+        :param overflow: what to do when the buffer is full:
+            ``'drop-oldest'``, ``'drop-newest'``, or ``'block'``
+        :param int history: the number of recent lines to keep for reference
+        :param strip_escapes: whether to remove terminal escape sequences
+
+        Raises :exc:`~oraide.output.PipeInUseError` if the session's output
+        is already piped elsewhere, such as to another stream.
+        """
+        from .output import OutputStream
+        return OutputStream(self, buffer_size=buffer_size, overflow=overflow,
+                            history=history, strip_escapes=strip_escapes)
 
     @prompt
-    def teletype(self, keys, delay=None):
-        """teletype(keys, delay=90)
+    def teletype(self, keys, delay=None, burst=None):
+        """teletype(keys, delay=90, burst=1)
         Type ``keys`` character-by-character, as if you were actually typing
         them by hand.
 
@@ -167,25 +960,82 @@ class Session(object):
         percent more or less than the nominal value. The default, 90
         milliseconds, approximates a fast typist.
 
+        To send fewer commands to tmux, set ``burst`` to send up to that many
+        characters at once. Bursts end at word boundaries and never split a
+        character from its combining marks, and the pause after each burst is
+        lengthened to keep the same typing speed. At a normal viewing
+        distance, bursts of 2 to 4 characters look the same as typing one
+        character at a time.
+
         .. note:: |auto-advancing|
 
         :param keys: the literal keys to be typed
         :param int delay: the nominal time between keystrokes in milliseconds.
+        :param int burst: the largest number of characters to send at once
         """
         if delay is None:
             delay = (self.teletype_delay if self.teletype_delay is not None
                      else 90)
 
-        delay_variation = delay / 10
-
-        with self.auto_advance():
+        with self.auto_advance(), self._flow.typing():
             logger.info('[%s] Sending %s', self.session, repr(keys))
+            self._teletype_keys(keys, delay, burst)
+
+    @prompt
+    def teletype_stream(self, source, delay=None, encoding='utf-8',
+                        burst=None):
+        """teletype_stream(source, delay=90, encoding='utf-8', burst=1)
+        Type the contents of ``source`` character-by-character, like
+        :meth:`teletype`, reading it lazily instead of all at once.
+
+        ``source`` may be a string, a file object (opened in text or binary
+        mode), or any iterable of strings, such as a generator. Byte strings
+        are decoded incrementally with ``encoding``.
+
+        .. note:: |auto-advancing|
+
+        :param source: the text, file object, or iterable of strings to type
+        :param int delay: the nominal time between keystrokes in milliseconds
+        :param encoding: the encoding used to decode byte strings
+        :param int burst: the largest number of characters to send at once
+            (see :meth:`teletype`)
+        """
+        if delay is None:
+            delay = (self.teletype_delay if self.teletype_delay is not None
+                     else 90)
+
+        with self.auto_advance(), self._flow.typing():
+            logger.info('[%s] Sending from %s', self.session, repr(source))
+            chunks = _iter_text(source, encoding=encoding)
+            for chunk in _iter_whole_graphemes(chunks):
+                self._teletype_keys(chunk, delay, burst)
+
+    def _teletype_keys(self, keys, delay, burst=None):
+        flow = self._flow
+        flow.check()
+        if self.fast_forwarding:
+            if keys:
+                self.send_keys(keys)
+            return
+
+        if burst is None:
+            burst = self.teletype_burst if self.teletype_burst else 1
+
+        delay_variation = delay // 10
+        shortest = delay - delay_variation
+        longest = delay + delay_variation
+        send = self.send_literal_char
+        randint = random.randint
+
+        if burst <= 1:
             for key in keys:
-                self.send_keys(key)
+                send(key)
+                _sleep(randint(shortest, longest) / 1000.0, flow)
+            return
 
-                current_delay = random.randint(delay - delay_variation,
-                                               delay + delay_variation)
-                time.sleep(current_delay / 1000.0)
+        for keys_burst, length in _iter_bursts(keys, burst):
+            send(keys_burst)
+            _sleep(randint(shortest, longest) * length / 1000.0, flow)
 
     @prompt
     def enter(self, keys=None, teletype=True, after=keyboard.enter):
@@ -206,16 +1056,42 @@ class Session(object):
             keys from :mod:`oraide.keys`, like the default, :kbd:`Enter`)
         """
 
-        if keys:
-            if teletype:
+        with self._flow.typing():
+            if keys:
+                if teletype:
+                    with self.auto_advance():
+                        self.teletype(keys)
+                else:
+                    self._flow.check()
+                    self.send_keys(keys)
+
+            if after:
+                self._flow.check()
                 with self.auto_advance():
-                    self.teletype(keys)
-            else:
-                self.send_keys(keys)
+                    self.send_keys(after, literal=False)
+
+    @prompt
+    def enter_stream(self, source, teletype=True, after=keyboard.enter,
+                     encoding='utf-8'):
+        """enter_stream(source, teletype=True, after='Enter', encoding='utf-8')
+        Type each line of ``source``, pressing :kbd:`Enter` after each one.
 
-        if after:
-            with self.auto_advance():
-                self.send_keys(after, literal=False)
+        ``source`` is read lazily, exactly as in :meth:`teletype_stream`, so
+        large files or generated content can be typed without first reading
+        them into memory. Each line is sent as if by :meth:`enter`.
+
+        .. note:: |auto-advancing| The prompt appears once, before the first
+           line is sent.
+
+        :param source: the text, file object, or iterable of strings to type
+        :param teletype: whether to enable simulated typing
+        :param after: additional keystrokes to send after each line with
+            ``literal`` set to ``False``
+        :param encoding: the encoding used to decode byte strings
+        """
+        with self.auto_advance(), self._flow.typing():
+            for line in _iter_lines(source, encoding=encoding):
+                self.enter(line, teletype=teletype, after=after)
 
     @contextmanager
     def auto_advance(self):
@@ -230,11 +1106,16 @@ class Session(object):
                session.teletype('jjji')
                session.enter('Hello, World!', after=keys.escape)
            session.enter(':x')                   # prompt first
+
+        Prompts are disabled only for the current thread or asyncio task, and
+        the previous state is restored even if an exception is raised.
         """
-        initial_auto_state = self.auto_advancing
-        self.auto_advancing = True
-        yield
-        self.auto_advancing = initial_auto_state
+        token = _auto_advancing.set(self, True)
+        try:
+            yield
+        finally:
+            _auto_advancing.reset(token)
 
 
-__all__ = ['send_keys', 'Session']
+__all__ = ['capture_pane', 'Checkpoints', 'send_keys', 'server_health',
+           'ServerHealth', 'Session']
@@ -0,0 +1,128 @@
+"""Command-line tools for oraide. Run ``python -m oraide --help`` for usage."""
+
+import argparse
+import sys
+
+
+def profile(options):
+    from .profiling import run_script
+    run_script(options.script, options.args, flamegraph=options.flamegraph)
+
+
+def stress(options):
+    from .stress import run_curve
+    levels = [int(level) for level in options.sessions.split(',')]
+    run_curve(levels, mode=options.mode, concurrency=options.concurrency,
+              keystrokes=options.keystrokes, csv_path=options.csv)
+
+
+def serve(options):
+    import logging
+    from .daemon import Daemon
+    logging.basicConfig(level=logging.INFO)
+    daemon = Daemon(options.socket, socket_name=options.tmux_socket)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def replay(options):
+    from .journal import dump, replay
+    if options.dry_run:
+        dump(options.journal)
+    else:
+        replay(options.journal, session=options.session,
+               socket_name=options.tmux_socket, speed=options.speed)
+
+
+def agent(options):
+    import logging
+    from .remote import Agent
+    logging.basicConfig(level=logging.INFO)
+    try:
+        server = Agent(options.host, options.port)
+    except ValueError as exc:
+        sys.exit('python -m oraide agent: {}'.format(exc))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m oraide')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    profile_parser = commands.add_parser(
+        'profile', help='run a script and report where its time was spent')
+    profile_parser.add_argument('script', help='the Python script to run')
+    profile_parser.add_argument('args', nargs=argparse.REMAINDER,
+                                help='arguments for the script')
+    profile_parser.add_argument('--flamegraph', metavar='FILE',
+                                help='save the profile in the folded flame '
+                                     'graph format')
+    profile_parser.set_defaults(func=profile)
+
+    stress_parser = commands.add_parser(
+        'stress', help='measure throughput and latency as sessions increase')
+    stress_parser.add_argument('--sessions', default='1,2,4,8,16',
+                               help='comma-separated numbers of sessions to '
+                                    'measure (default: %(default)s)')
+    stress_parser.add_argument('--mode', default='threads',
+                               choices=['threads', 'processes', 'select'])
+    stress_parser.add_argument('--concurrency', type=int,
+                               help='number of workers, or of tmux commands '
+                                    'in flight (default: one per session)')
+    stress_parser.add_argument('--keystrokes', type=int, default=50,
+                               help='keystrokes to send to each session '
+                                    '(default: %(default)s)')
+    stress_parser.add_argument('--csv', metavar='FILE',
+                               help='save the results as CSV')
+    stress_parser.set_defaults(func=stress)
+
+    serve_parser = commands.add_parser(
+        'serve', help='run scripts sent as JSON over a Unix socket')
+    serve_parser.add_argument('--socket', default='oraide.sock',
+                              help='the Unix socket on which to listen '
+                                   '(default: %(default)s)')
+    serve_parser.add_argument('--tmux-socket', metavar='NAME',
+                              help="the name of the tmux server's socket")
+    serve_parser.set_defaults(func=serve)
+
+    replay_parser = commands.add_parser(
+        'replay', help='send the keystrokes recorded in a journal again')
+    replay_parser.add_argument('journal', help='the journal file')
+    replay_parser.add_argument('--session',
+                               help='send every keystroke to this session '
+                                    'instead of the original ones')
+    replay_parser.add_argument('--tmux-socket', metavar='NAME',
+                               help="the name of the tmux server's socket "
+                                    '(with --session)')
+    replay_parser.add_argument('--speed', type=float, default=1.0,
+                               help='how many times faster than recorded to '
+                                    'replay, or 0 for no delays (default: '
+                                    '%(default)s)')
+    replay_parser.add_argument('--dry-run', action='store_true',
+                               help='print the keystrokes instead of '
+                                    'sending them')
+    replay_parser.set_defaults(func=replay)
+
+    agent_parser = commands.add_parser(
+        'agent', help='run commands from a remote controller (see '
+                      'oraide.remote)')
+    agent_parser.add_argument('--host', default='127.0.0.1',
+                              help='the address on which to listen '
+                                   '(default: %(default)s)')
+    agent_parser.add_argument('--port', type=int, default=7397,
+                              help='the port on which to listen '
+                                   '(default: %(default)s)')
+    agent_parser.set_defaults(func=agent)
+
+    options = parser.parse_args(argv)
+    options.func(options)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
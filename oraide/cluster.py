@@ -0,0 +1,268 @@
+"""This module spreads many sessions across several tmux servers and worker
+processes, so that driving a whole classroom of panes uses every core of the
+host instead of one Python process and one tmux server. For example:
+
+.. code-block:: python
+
+   from oraide.cluster import Cluster
+
+   with Cluster(['lab{}'.format(i) for i in range(100)]) as cluster:
+       results = cluster.run(dict(
+           (name, [{'op': 'enter', 'args': ['make test']}])
+           for name in cluster.sessions))
+
+Each shard is a private tmux server (on its own socket) with its share of the
+sessions, and a worker process that drives them. Inside each worker, every
+session types on its own thread, exactly like a job sent to the daemon (see
+:mod:`oraide.daemon`, whose step format is used here too), so typing speed
+doesn't depend on how many sessions share the shard.
+
+The coordinator (the :class:`Cluster`) sends each job to the shard that owns
+its session, and collects the events of every job into a :class:`Result`.
+"""
+
+import itertools
+import multiprocessing
+import signal
+import threading
+import time
+
+from oraide import control
+from oraide.daemon import Job, SessionWorker
+from oraide.server import PrivateServer
+
+_clock = getattr(time, 'monotonic', time.time)
+
+
+class ClusterError(RuntimeError):
+    """At least one job run with :meth:`Cluster.run` failed. The
+    ``results`` attribute holds every job's :class:`Result`, keyed by
+    session."""
+
+    def __init__(self, results):
+        self.results = results
+        failed = sorted(session for session, result in results.items()
+                        if result.error is not None)
+        super(ClusterError, self).__init__('{} of {} jobs failed: {}'.format(
+            len(failed), len(results), ', '.join(failed)))
+
+
+class Result(object):
+    """The progress of one job on a :class:`Cluster`.
+
+    ``events`` collects the job's events as they arrive (see
+    :mod:`oraide.daemon`). Once the job is finished, ``error`` is ``None`` if
+    it succeeded, or a description of what went wrong.
+    """
+
+    def __init__(self, session, shard):
+        self.session = session
+        self.shard = shard
+        self.events = []
+        self.error = None
+        self._finished = threading.Event()
+
+    @property
+    def done(self):
+        """Whether the job has finished, successfully or not."""
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        """Wait until the job finishes, or for ``timeout`` seconds, and return
+        whether it has finished."""
+        self._finished.wait(timeout)
+        return self.done
+
+    def _receive(self, event):
+        self.events.append(event)
+        if event['event'] == 'error':
+            self.error = '{type}: {message}'.format(**event)
+        if event['event'] in ('done', 'error'):
+            self._finished.set()
+
+
+def _serve_shard(socket_name, connection):
+    """Run jobs from the coordinator for the sessions on one tmux server,
+    until the coordinator sends ``None`` or goes away."""
+    # the coordinator decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    send_lock = threading.Lock()
+    workers = {}
+
+    def replier(job_id):
+        def reply(event):
+            event['id'] = job_id
+            with send_lock:
+                connection.send(event)
+        return reply
+
+    try:
+        for job_id, session, steps in iter(connection.recv, None):
+            worker = workers.get(session)
+            if worker is None:
+                worker = workers[session] = SessionWorker(
+                    session, socket_name=socket_name)
+            worker.submit(Job({'id': job_id, 'steps': steps},
+                              replier(job_id)))
+    except EOFError:
+        pass
+    finally:
+        for worker in workers.values():
+            worker.stop()
+        control.disconnect(socket_name)
+
+
+class Cluster(object):
+    """Sessions sharded across several private tmux servers, each driven by
+    its own worker process. Use it as a context manager to start the shards
+    and stop them when finished.
+
+    :param sessions: the names of the sessions to start, or how many to
+        start (at least one)
+    :param int shards: the number of tmux servers and worker processes
+        (by default, one per CPU, but never more than there are sessions)
+    :param command: the command to run in each session, or ``None`` for a
+        shell
+    """
+
+    def __init__(self, sessions, shards=None, command=None):
+        if isinstance(sessions, int):
+            sessions = ['session{}'.format(i) for i in range(sessions)]
+        self.sessions = list(sessions)
+        if not self.sessions:
+            raise ValueError('a cluster needs at least one session')
+        shards = max(min(shards or multiprocessing.cpu_count(),
+                         len(self.sessions)), 1)
+        self.servers = [PrivateServer(self.sessions[i::shards],
+                                      command=command)
+                        for i in range(shards)]
+        self._shards = dict((session, index)
+                            for index, server in enumerate(self.servers)
+                            for session in server.sessions)
+        self._connections = []
+        self._processes = []
+        self._readers = []
+        self._pending = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Start each shard's tmux server and worker process."""
+        for server in self.servers:
+            server.start()
+            connection, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_serve_shard, args=(server.socket_name, child))
+            process.daemon = True
+            process.start()
+            child.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+        # started after forking, so no worker inherits them
+        for index in range(len(self.servers)):
+            reader = threading.Thread(target=self._read, args=(index,))
+            reader.daemon = True
+            reader.start()
+            self._readers.append(reader)
+
+    def stop(self):
+        """Finish the jobs already sent, then stop the worker processes and
+        tmux servers."""
+        with self._lock:
+            for connection in self._connections:
+                try:
+                    connection.send(None)
+                except (IOError, OSError):
+                    pass
+        for process in self._processes:
+            process.join(10.0)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        for reader in self._readers:
+            reader.join()
+        for connection in self._connections:
+            connection.close()
+        for server in self.servers:
+            server.kill()
+        self._connections, self._processes, self._readers = [], [], []
+
+    def socket_name(self, session):
+        """Return the name of the socket of the tmux server that runs
+        ``session``, for use with :class:`oraide.Session`."""
+        return self.servers[self._shard(session)].socket_name
+
+    def submit(self, session, steps):
+        """Send a job (a list of steps, as for :func:`oraide.daemon.submit`)
+        to the shard that runs ``session``, and return its :class:`Result`
+        at once."""
+        index = self._shard(session)
+        result = Result(session, index)
+        with self._lock:
+            job_id = next(self._ids)
+            self._pending[job_id] = result
+            self._connections[index].send((job_id, session, steps))
+        return result
+
+    def run(self, jobs, timeout=None):
+        """Run jobs in several sessions at once, wait for all of them to
+        finish, and return their results, keyed by session. Raises
+        :exc:`ClusterError` if any job failed or didn't finish in time.
+
+        :param jobs: a dictionary of lists of steps, keyed by session
+        :param timeout: the longest time to wait for all the jobs, in
+            seconds
+        """
+        deadline = None if timeout is None else _clock() + timeout
+        results = dict((session, self.submit(session, steps))
+                       for session, steps in jobs.items())
+        for result in results.values():
+            remaining = (None if deadline is None
+                         else max(deadline - _clock(), 0))
+            if not result.wait(remaining):
+                result.error = 'timed out'
+        if any(result.error is not None for result in results.values()):
+            raise ClusterError(results)
+        return results
+
+    def _shard(self, session):
+        try:
+            return self._shards[session]
+        except KeyError:
+            raise ValueError('unknown session: {!r}'.format(session))
+
+    def _read(self, index):
+        connection = self._connections[index]
+        while True:
+            try:
+                event = connection.recv()
+            except (EOFError, IOError, OSError):
+                break
+            with self._lock:
+                if event['event'] in ('done', 'error'):
+                    result = self._pending.pop(event['id'], None)
+                else:
+                    result = self._pending.get(event['id'])
+            if result is not None:
+                result._receive(event)
+
+        # the worker process exited; its unfinished jobs never will
+        with self._lock:
+            lost = [job_id for job_id, result in self._pending.items()
+                    if result.shard == index]
+            lost = [self._pending.pop(job_id) for job_id in lost]
+        for result in lost:
+            result._receive({'event': 'error', 'type': 'ShardLost',
+                             'message': 'the worker process for shard {} '
+                                        'exited'.format(index)})
+
+
+__all__ = ['Cluster', 'ClusterError', 'Result']
@@ -0,0 +1,184 @@
+"""This module keeps a persistent connection to a tmux server, using tmux's
+control mode (``tmux -C``), so that commands don't each start a new tmux
+client process. While a connection is open, oraide sends every command for
+that server (such as the keystrokes from :meth:`oraide.Session.teletype`)
+through it:
+
+.. code-block:: python
+
+   from oraide import control
+
+   control.connect(target='my_session')
+   session.teletype('no new process per keystroke')
+   control.disconnect()
+
+Commands that can't be written on a single line of the control mode protocol
+(such as keystrokes containing a newline) still start a tmux client, as does
+every command after the connection is lost.
+"""
+
+import logging
+import subprocess
+import threading
+from collections import deque
+
+import oraide
+
+logger = logging.getLogger(__name__)
+
+CONNECTION_LOST = b'failed to connect to server (control client exited)'
+
+
+def quote(arg):
+    """Quote an argument for tmux's command parser."""
+    return u"'" + arg.replace(u"'", u"'\\''") + u"'"
+
+
+class _Reply(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.lines = []
+        self.returncode = None
+
+
+class ControlClient(object):
+    """A tmux control mode client. Use :func:`connect` to create one.
+
+    :param socket_name: the name of the tmux server's socket, or ``None`` for
+        the default server
+    :param target: the session to attach to (any existing session will do;
+        by default, the most recently used one)
+    """
+
+    def __init__(self, socket_name=None, target=None):
+        self.socket_name = socket_name
+        self.target = target
+        self.closed = False
+        self._prefix = len(oraide._tmux_command(socket_name))
+        self._pending = deque()
+        self._write_lock = threading.Lock()
+
+        args = oraide._tmux_command(socket_name, '-C', 'attach-session')
+        if target is not None:
+            args.append('-t{}'.format(target))
+        self._proc = subprocess.Popen(args, stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.STDOUT)
+
+        # the reply to attaching, which arrives before any other
+        self._attached = _Reply()
+        self._pending.append(self._attached)
+        self._reader = threading.Thread(target=self._read)
+        self._reader.daemon = True
+        self._reader.start()
+
+    def execute(self, args):
+        """Run a tmux command (a full argument list, as passed to
+        :mod:`subprocess`) and return its exit status and output, or return
+        ``None`` if the command can't be sent over this connection."""
+        args = args[self._prefix:]
+        if self.closed or any(u'\n' in arg or u'\r' in arg for arg in args):
+            return None
+
+        line = u' '.join([args[0]] + [quote(arg) for arg in args[1:]])
+        reply = _Reply()
+        with self._write_lock:
+            if self.closed:
+                return None
+            self._pending.append(reply)
+            try:
+                self._proc.stdin.write(line.encode(oraide._encoding) + b'\n')
+                self._proc.stdin.flush()
+            except (IOError, OSError):
+                self._pending.remove(reply)
+                self._lost()
+                return None
+
+        reply.event.wait()
+        return reply.returncode, b''.join(reply.lines)
+
+    def close(self):
+        """Detach from the tmux server."""
+        with self._write_lock:
+            if not self.closed:
+                try:
+                    self._proc.stdin.close()
+                except (IOError, OSError):
+                    pass
+        self._reader.join()
+        self._proc.wait()
+
+    def _read(self):
+        reply = None
+        number = None
+        for line in iter(self._proc.stdout.readline, b''):
+            if reply is None:
+                if line.startswith(b'%begin '):
+                    number = line.split()[2]
+                    with self._write_lock:
+                        reply = self._pending.popleft()
+                elif line.startswith(b'%exit'):
+                    break
+                continue
+
+            fields = line.split()
+            if (len(fields) >= 3 and fields[2] == number and
+                    fields[0] in (b'%end', b'%error')):
+                reply.returncode = 0 if fields[0] == b'%end' else 1
+                reply.event.set()
+                reply = None
+            else:
+                reply.lines.append(line)
+
+        if reply is not None:
+            self._pending.appendleft(reply)
+        self._lost()
+
+    def _lost(self):
+        """Fail every command still waiting for a reply, and stop using this
+        connection."""
+        self.closed = True
+        if oraide._control_clients.get(self.socket_name) is self:
+            del oraide._control_clients[self.socket_name]
+        while self._pending:
+            reply = self._pending.popleft()
+            reply.returncode = 1
+            reply.lines = [CONNECTION_LOST]
+            reply.event.set()
+
+
+def connect(socket_name=None, target=None):
+    """Open a control mode connection to a tmux server, and send oraide's
+    commands for that server through it until :func:`disconnect` is called.
+    Return the :class:`ControlClient`.
+
+    Raises :exc:`oraide.ConnectionFailedError` if the server is not running.
+
+    :param socket_name: the name of the tmux server's socket, or ``None`` for
+        the default server
+    :param target: the session to attach to
+    """
+    existing = oraide._control_clients.get(socket_name)
+    if existing is not None and not existing.closed:
+        return existing
+
+    client = ControlClient(socket_name, target=target)
+    client._attached.event.wait(5.0)
+    if client.closed or client._attached.returncode != 0:
+        client.close()
+        raise oraide.ConnectionFailedError(
+            1, 'tmux -C attach-session', b''.join(client._attached.lines))
+    oraide._control_clients[socket_name] = client
+    logger.info('Connected to tmux server %s in control mode',
+                socket_name or '(default)')
+    return client
+
+
+def disconnect(socket_name=None):
+    """Close the control mode connection to a tmux server, if one is open."""
+    client = oraide._control_clients.pop(socket_name, None)
+    if client is not None:
+        client.close()
+
+
+__all__ = ['connect', 'ControlClient', 'disconnect']
@@ -0,0 +1,319 @@
+"""This module runs oraide as a long-lived daemon, so that starting a scripted
+demonstration doesn't mean starting Python, importing oraide, and checking
+tmux all over again. Start the daemon from the command line:
+
+.. code-block:: console
+
+   $ python -m oraide serve --socket /tmp/oraide.sock
+
+Then send it jobs with :func:`submit`, or with any program that can write
+JSON to a Unix socket. Each job is a list of steps for one session:
+
+.. code-block:: python
+
+   from oraide.daemon import submit
+
+   for event in submit('/tmp/oraide.sock', 'my_session', [
+           {'op': 'enter', 'args': ['ls -l']},
+           {'op': 'sleep', 'args': [1.5]},
+           {'op': 'teletype', 'args': ['echo done'], 'kwargs': {'delay': 50}},
+   ]):
+       print(event)
+
+The daemon keeps a :class:`oraide.Session` (with auto-advance enabled) for
+each session it has seen, and a control mode connection to each tmux server
+(see :mod:`oraide.control`), so keystrokes don't start new tmux processes.
+Jobs for the same session run one after another, in the order they arrived;
+jobs for different sessions run at the same time.
+
+Protocol
+--------
+
+Requests and responses are JSON objects, one per line. A request is
+``{"op": "ping"}``, or ``{"op": "pause", "session": "my_session"}`` (likewise
+``resume`` and ``cancel``) to steer the job running in a session at once, as
+with :meth:`oraide.Session.pause`, or:
+
+.. code-block:: json
+
+   {"op": "run", "id": 7, "session": "my_session", "steps": [...]}
+
+where each step is ``{"op": <name>, "args": [...], "kwargs": {...}}``, and
+``<name>`` is ``sleep`` or one of the :class:`oraide.Session` methods in
+``STEP_OPS``. The daemon replies with a stream of events that carry the
+request's ``id``: ``queued`` (with the number of jobs ahead of it),
+``started``, one ``step`` event for each step (with the step's ``result``,
+if any), and finally ``done`` or ``error`` (with the exception's ``type``
+and ``message``; a cancelled job ends with an error of type ``Cancelled``).
+Pause, resume, and cancel requests are answered with a single ``ok``
+event, and a request that can't be understood with a single ``error``
+event.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+
+try:
+    import queue
+    import socketserver
+except ImportError:  # Python 2
+    import Queue as queue
+    import SocketServer as socketserver
+
+import oraide
+from oraide import control
+
+logger = logging.getLogger(__name__)
+
+STEP_OPS = ('send_keys', 'send_literal_char', 'teletype', 'enter',
+            'checkpoint', 'screen')
+FLOW_OPS = ('pause', 'resume', 'cancel')
+
+
+class Job(object):
+    """A list of steps to run in a :class:`SessionWorker`'s session.
+
+    :param request: a ``run`` request (see the protocol above), of which the
+        ``id`` and ``steps`` are used
+    :param reply: a function called with each of the job's events
+    """
+
+    def __init__(self, request, reply):
+        self.id = request.get('id')
+        self.steps = request.get('steps', [])
+        self.reply = reply
+
+
+class SessionWorker(object):
+    """Runs the jobs for one session, one at a time, on its own thread.
+
+    :param name: the name of the tmux session
+    :param socket_name: the name of the tmux server's socket, or ``None`` for
+        the default server
+    """
+
+    def __init__(self, name, socket_name=None):
+        self.session = oraide.Session(name, enable_auto_advance=True,
+                                      socket_name=socket_name)
+        self.jobs = queue.Queue()
+        self.unfinished = 0
+        self._lock = threading.Lock()
+        self.thread = threading.Thread(target=self._work)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, job):
+        """Queue a :class:`Job`, after any others for the session."""
+        with self._lock:
+            position = self.unfinished
+            self.unfinished += 1
+        job.reply({'event': 'queued', 'position': position})
+        self.jobs.put(job)
+
+    def stop(self):
+        """Finish the queued jobs, then stop the thread."""
+        self.jobs.put(None)
+        self.thread.join()
+
+    def _work(self):
+        for job in iter(self.jobs.get, None):
+            job.reply({'event': 'started'})
+            flow = self.session._flow
+            try:
+                self._connect()
+                with flow.typing():
+                    for index, step in enumerate(job.steps):
+                        flow.check()
+                        result = self._run_step(step)
+                        job.reply({'event': 'step', 'index': index,
+                                   'op': step.get('op'), 'result': result})
+            except Exception as exc:
+                logger.exception('[%s] Job %s failed', self.session.session,
+                                 job.id)
+                outcome = {'event': 'error', 'type': type(exc).__name__,
+                           'message': str(exc)}
+            else:
+                outcome = {'event': 'done'}
+
+            with self._lock:
+                self.unfinished -= 1
+            job.reply(outcome)
+
+    def _connect(self):
+        socket_name = self.session.socket_name
+        if socket_name not in oraide._control_clients:
+            try:
+                control.connect(socket_name, target=self.session.session)
+            except oraide.ConnectionFailedError:
+                pass  # commands fall back to starting tmux
+
+    def _run_step(self, step):
+        op = step.get('op')
+        args = step.get('args', [])
+        kwargs = step.get('kwargs', {})
+        if op == 'sleep':
+            oraide._sleep(*args, flow=self.session._flow, **kwargs)
+            return None
+        if op not in STEP_OPS:
+            raise ValueError('unknown step: {!r}'.format(op))
+        return getattr(self.session, op)(*args, **kwargs)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        write_lock = threading.Lock()
+        finished = []
+
+        for line in iter(self.rfile.readline, b''):
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError as exc:
+                self._error(write_lock, None, str(exc))
+                continue
+            if not isinstance(request, dict):
+                self._error(write_lock, None, 'a request must be a JSON '
+                                              'object')
+                continue
+
+            if request.get('op') == 'ping':
+                self._write(write_lock, {'event': 'pong'})
+            elif request.get('op') in FLOW_OPS:
+                self.server.oraide_daemon.steer(request.get('op'),
+                                                request.get('session'))
+                self._write(write_lock, {'id': request.get('id'),
+                                         'event': 'ok'})
+            elif request.get('op') == 'run':
+                if not isinstance(request.get('steps', []), list):
+                    self._error(write_lock, request.get('id'),
+                                'steps must be a list')
+                    continue
+                done = threading.Event()
+                finished.append(done)
+                reply = self._replier(write_lock, request, done)
+                self.server.oraide_daemon.submit(request, reply)
+            else:
+                self._error(write_lock, request.get('id'),
+                            'unknown op: {!r}'.format(request.get('op')))
+
+        for done in finished:
+            done.wait()
+
+    def _replier(self, write_lock, request, done):
+        def reply(event):
+            event['id'] = request.get('id')
+            try:
+                self._write(write_lock, event)
+            except (IOError, OSError):
+                pass  # the client went away; keep running the job
+            if event['event'] in ('done', 'error'):
+                done.set()
+        return reply
+
+    def _error(self, write_lock, request_id, message):
+        self._write(write_lock, {'id': request_id, 'event': 'error',
+                                 'type': 'ValueError', 'message': message})
+
+    def _write(self, write_lock, event):
+        data = (json.dumps(event) + '\n').encode('utf-8')
+        with write_lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Daemon(object):
+    """A server that runs jobs from clients connected to a Unix socket.
+
+    :param path: the path of the Unix socket on which to listen
+    :param socket_name: the name of the tmux server's socket, or ``None`` for
+        the default server
+    """
+
+    def __init__(self, path, socket_name=None):
+        self.path = path
+        self.socket_name = socket_name
+        self.workers = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            os.unlink(path)
+        self.server = _Server(path, _Handler)
+        self.server.oraide_daemon = self
+
+    def submit(self, request, reply):
+        """Queue a ``run`` request, sending its events to ``reply``."""
+        name = request.get('session')
+        with self._lock:
+            worker = self.workers.get(name)
+            if worker is None:
+                worker = self.workers[name] = SessionWorker(
+                    name, socket_name=self.socket_name)
+        worker.submit(Job(request, reply))
+
+    def steer(self, op, name):
+        """Pause, resume, or cancel (according to ``op``) the job running in
+        the session ``name``."""
+        with self._lock:
+            worker = self.workers.get(name)
+        if worker is not None:
+            getattr(worker.session, op)()
+
+    def serve_forever(self):
+        """Handle requests until :meth:`shutdown` is called."""
+        logger.info('Listening on %s', self.path)
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def shutdown(self):
+        """Stop :meth:`serve_forever` (from another thread)."""
+        self.server.shutdown()
+
+    def close(self):
+        """Stop the workers, disconnect from tmux, and remove the socket."""
+        self.server.server_close()
+        with self._lock:
+            workers, self.workers = list(self.workers.values()), {}
+        for worker in workers:
+            worker.stop()
+        control.disconnect(self.socket_name)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def submit(path, session, steps, job_id=None):
+    """Send a job to the daemon listening at ``path`` and yield its events,
+    as dictionaries, until the job is done. Raises :exc:`RuntimeError` if the
+    job fails.
+
+    :param path: the path of the daemon's Unix socket
+    :param session: the name of the tmux session
+    :param steps: a list of steps, as described in the protocol above
+    :param job_id: an identifier for the job, echoed in each event
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(path)
+    try:
+        request = {'op': 'run', 'id': job_id, 'session': session,
+                   'steps': steps}
+        client.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        reader = client.makefile('rb')
+        for line in iter(reader.readline, b''):
+            event = json.loads(line.decode('utf-8'))
+            yield event
+            if event['event'] == 'error':
+                raise RuntimeError('{type}: {message}'.format(**event))
+            if event['event'] == 'done':
+                return
+    finally:
+        client.close()
+
+
+__all__ = ['Daemon', 'Job', 'SessionWorker', 'submit']
@@ -0,0 +1,215 @@
+"""This module records every keystroke oraide sends, and when, so that a run
+can be audited or reproduced exactly. Start a journal before the script runs:
+
+.. code-block:: python
+
+   from oraide import journal
+
+   journal.start('demo.journal')
+   session.enter('make')
+   journal.stop()
+
+Then replay it, with the original timing or faster:
+
+.. code-block:: console
+
+   $ python -m oraide replay demo.journal --speed 2
+   $ python -m oraide replay demo.journal --session scratch --dry-run
+
+The journal is an append-only binary file. Records are packed into an
+in-memory buffer, which is written out whenever it fills up and when the
+journal is flushed or stopped, so recording a keystroke costs about as much as
+appending to a list. Each run appended to a file begins with a ``start``
+record; timestamps are seconds since the start of their run, read from a
+monotonic clock.
+"""
+
+from __future__ import division, print_function
+
+import atexit
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import oraide
+
+MAGIC = b'ORAIDEJ1'
+
+# seconds, target number, kind, payload length
+RECORD = struct.Struct('<dHBI')
+
+KIND_START = 0
+KIND_TARGET = 1
+KIND_KEYS = 2
+KIND_LITERAL = 3
+
+Entry = namedtuple('Entry', 'time socket_name session keys literal')
+Entry.__doc__ = """One send, as read from a journal."""
+
+
+class Journal(object):
+    """An open journal file. Use :func:`start` to record oraide's sends in
+    one.
+
+    :param path: the path of the journal; new runs are appended to an
+        existing file
+    :param int buffer_size: the number of bytes to buffer before writing
+        (``0`` writes every record immediately)
+    """
+
+    def __init__(self, path, buffer_size=65536):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.closed = False
+        self._buffer = bytearray()
+        self._targets = {}
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+
+        self._origin = oraide._clock()
+        self._append(KIND_START, 0, time.strftime('%Y-%m-%dT%H:%M:%S%z'))
+
+    def record(self, socket_name, session, keys, literal=True):
+        """Append a send to the journal."""
+        kind = KIND_LITERAL if literal else KIND_KEYS
+        with self._lock:
+            if self.closed:
+                return
+            target = self._targets.get((socket_name, session))
+            if target is None:
+                target = self._targets[(socket_name, session)] = len(
+                    self._targets)
+                self._append(KIND_TARGET, target,
+                             u'{}\0{}'.format(socket_name or u'', session))
+            self._append(kind, target, keys)
+
+    def flush(self):
+        """Write buffered records to the file."""
+        with self._lock:
+            self._write()
+
+    def close(self):
+        """Flush the journal and close the file."""
+        with self._lock:
+            if self.closed:
+                return
+            self._write()
+            self._file.close()
+            self.closed = True
+
+    def _append(self, kind, target, text):
+        payload = text.encode('utf-8')
+        self._buffer += RECORD.pack(oraide._clock() - self._origin, target,
+                                    kind, len(payload))
+        self._buffer += payload
+        if len(self._buffer) >= self.buffer_size:
+            self._write()
+
+    def _write(self):
+        if self._buffer and not self.closed:
+            self._file.write(self._buffer)
+            self._file.flush()
+            del self._buffer[:]
+
+
+def start(path, buffer_size=65536):
+    """Record every send in the journal at ``path`` until :func:`stop` is
+    called. Return the :class:`Journal`.
+
+    :param path: the path of the journal
+    :param int buffer_size: the number of bytes to buffer before writing
+    """
+    stop()
+    oraide._journal = Journal(path, buffer_size=buffer_size)
+    return oraide._journal
+
+
+def stop():
+    """Stop recording, and close the journal."""
+    journal, oraide._journal = oraide._journal, None
+    if journal is not None:
+        journal.close()
+
+
+atexit.register(stop)
+
+
+def read(path):
+    """Yield each send in the journal at ``path`` as an :class:`Entry`.
+    Times are seconds since the start of the journal's first run; runs
+    appended later follow on directly from the end of the previous one."""
+    with open(path, 'rb') as fp:
+        if fp.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not an oraide journal'.format(path))
+
+        targets = {}
+        offset = 0.0
+        last = 0.0
+        while True:
+            header = fp.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return  # end of file, or a record cut short by a crash
+            seconds, target, kind, length = RECORD.unpack(header)
+            payload = fp.read(length)
+            if len(payload) < length:
+                return
+            text = payload.decode('utf-8')
+
+            if kind == KIND_START:
+                targets = {}
+                offset = last
+            elif kind == KIND_TARGET:
+                socket_name, session = text.split(u'\0', 1)
+                targets[target] = (socket_name or None, session)
+            else:
+                last = offset + seconds
+                socket_name, session = targets[target]
+                yield Entry(last, socket_name, session, text,
+                            kind == KIND_LITERAL)
+
+
+def replay(path, session=None, socket_name=None, speed=1.0):
+    """Send the keystrokes in a journal again, with the same timing.
+
+    Each send is scheduled relative to the start of the replay, not to the
+    previous send, so the time taken by tmux doesn't accumulate as drift.
+
+    :param path: the path of the journal
+    :param session: the session to send every keystroke to (by default, the
+        session it was originally sent to)
+    :param socket_name: the name of the tmux server's socket, used with
+        ``session``
+    :param speed: how much faster than the original to replay (``2`` is
+        twice as fast); ``0`` replays without any delays
+    """
+    origin = oraide._clock()
+    for entry in read(path):
+        if speed:
+            delay = origin + entry.time / speed - oraide._clock()
+            if delay > 0:
+                oraide._sleep(delay)
+        if session is None:
+            target = (entry.session, entry.socket_name)
+        else:
+            target = (session, socket_name)
+        oraide.send_keys(target[0], entry.keys, literal=entry.literal,
+                         socket_name=target[1])
+
+
+def dump(path, stream=None):
+    """Print each send in a journal, one per line."""
+    stream = stream if stream is not None else sys.stdout
+    for entry in read(path):
+        target = entry.session
+        if entry.socket_name is not None:
+            target = u'{}:{}'.format(entry.socket_name, target)
+        print(u'{:10.3f} {} {}{!r}'.format(
+            entry.time, target, u'' if entry.literal else u'keys ',
+            entry.keys), file=stream)
+
+
+__all__ = ['dump', 'Entry', 'Journal', 'read', 'replay', 'start', 'stop']
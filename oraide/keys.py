@@ -25,12 +25,13 @@ key, the string ``'BSpace'`` may be replaced with a reference to
 as well as the function keys ``f1`` through ``f20``.
 """
 
+import re
 import sys
 
 
 # Function keys (e.g., F1, F2, F3, and so on)
 def _add_f_keys():
-    for i in range(1, 20):
+    for i in range(1, 21):
         setattr(sys.modules[__name__], 'f{}'.format(i), 'F{}'.format(i))
 _add_f_keys()
 
@@ -113,3 +114,39 @@ def alt(key):
           'A-A'
     """
     return 'A-{}'.format(key)
+
+
+# the modifier prefixes produced by :func:`control`, :func:`command`, and
+# :func:`alt` (plus tmux's own ``S-`` for Shift, and ``^`` for Ctrl)
+_MODIFIER_PATTERN = re.compile(r'^(?:[CMAS]-|\^(?=.))+', re.IGNORECASE)
+
+# the rest of tmux's key table, including its aliases and keypad keys
+_TMUX_KEYNAMES = ('IC', 'Insert', 'DC', 'Delete', 'NPage', 'PgDn', 'PPage',
+                  'PgUp', 'BTab', 'KP/', 'KP*', 'KP-', 'KP7', 'KP8', 'KP9',
+                  'KP+', 'KP4', 'KP5', 'KP6', 'KP1', 'KP2', 'KP3', 'KPEnter',
+                  'KP0', 'KP.')
+
+KEYNAMES = frozenset(
+    [value.lower() for name, value in list(vars().items())
+     if not name.startswith('_') and isinstance(value, str)] +
+    [name.lower() for name in _TMUX_KEYNAMES])
+
+
+def is_keyname(key):
+    """Return whether tmux will look up ``key`` as a single keystroke when it
+    is sent with ``literal`` set to ``False``: one of the keys provided by
+    this module, another name in tmux's key table (such as ``BTab``, ``DC``,
+    ``NPage``, or the keypad's ``KP5``), or a single character, any of them
+    optionally combined with modifiers from :func:`control`, :func:`command`,
+    or :func:`alt`. Key names are case-insensitive, as in tmux.
+
+    .. doctest::
+
+       >>> from oraide.keys import is_keyname
+       >>> is_keyname('C-Escape')
+       True
+       >>> is_keyname('Entr')
+       False
+    """
+    base = _MODIFIER_PATTERN.sub('', key)
+    return len(base) == 1 or base.lower() in KEYNAMES
@@ -0,0 +1,249 @@
+"""This module streams what a session prints, line by line, as it is printed.
+Use it through :meth:`oraide.Session.output`:
+
+.. code-block:: python
+
+   with session.output() as lines:
+       session.enter('make')
+       for line in lines:
+           if 'error' in line:
+               break
+
+tmux copies the pane's output into a named pipe (with its ``pipe-pane``
+command), and a background thread decodes it into lines. Lines wait in a
+bounded buffer until they are read. If the buffer fills up, the ``overflow``
+policy decides what happens:
+
+``'drop-oldest'``
+    discard the oldest unread line to make room (the default)
+``'drop-newest'``
+    discard the new line
+``'block'``
+    stop reading from the pipe until there is room, which eventually makes
+    tmux stop copying output to the pipe
+
+Separately, the most recent lines are kept for reference (see
+:meth:`OutputStream.recent`), whether or not they have been read.
+
+A pane has only one pipe, so only one stream can read a pane at a time, and
+not while its output is already piped elsewhere (with tmux's ``pipe-pane``
+command or another tool): :exc:`PipeInUseError` is raised instead of taking
+over the pipe.
+"""
+
+import codecs
+import errno
+import os
+import re
+import select
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+
+import oraide
+
+OVERFLOW_POLICIES = ('drop-oldest', 'drop-newest', 'block')
+
+# the most characters kept of a line that hasn't ended yet, such as a
+# progress bar redrawn with carriage returns but never a newline
+MAX_PARTIAL_LINE = 65536
+
+_clock = getattr(time, 'monotonic', time.time)
+
+# CSI sequences (colors, cursor movement) and OSC sequences (titles)
+ESCAPE_PATTERN = re.compile(u'\x1b\\[[0-?]*[ -/]*[@-~]|'
+                            u'\x1b\\][^\x07\x1b]*(?:\x07|\x1b\\\\)|'
+                            u'\x1b[@-Z\\\\-_]')
+
+
+class PipeInUseError(RuntimeError):
+    """The pane's output is already piped somewhere, such as to another
+    :class:`OutputStream`."""
+
+
+class OutputStream(object):
+    """An iterator of the lines printed in a session. Create it with
+    :meth:`oraide.Session.output`.
+
+    Iteration blocks until the next line is printed, and ends when the stream
+    is closed.
+
+    :param session: the :class:`oraide.Session` to read from
+    :param int buffer_size: the largest number of unread lines to keep
+    :param overflow: what to do when the buffer is full; one of
+        ``'drop-oldest'``, ``'drop-newest'``, or ``'block'``
+    :param int history: the number of recent lines to keep for
+        :meth:`recent`
+    :param strip_escapes: whether to remove terminal escape sequences, and
+        the text a carriage return writes over (as when a progress bar is
+        redrawn)
+    """
+
+    def __init__(self, session, buffer_size=1000, overflow='drop-oldest',
+                 history=100, strip_escapes=True):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('overflow must be one of {}'.format(
+                ', '.join(OVERFLOW_POLICIES)))
+        self.session = session
+        self.buffer_size = buffer_size
+        self.overflow = overflow
+        self.strip_escapes = strip_escapes
+        self.dropped = 0
+        self.closed = False
+
+        self._pending = deque()
+        self._history = deque(maxlen=history)
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._directory = tempfile.mkdtemp(prefix='oraide-')
+        self._fifo = os.path.join(self._directory, 'output')
+        os.mkfifo(self._fifo)
+
+        # opened read-write so neither this open nor tmux's blocks, and so
+        # reads never see end-of-file while tmux restarts its pipe
+        self._fd = os.open(self._fifo, os.O_RDWR | os.O_NONBLOCK)
+        self._reader = threading.Thread(target=self._read)
+        self._reader.daemon = True
+        self._reader.start()
+
+        try:
+            if self._piped():
+                raise PipeInUseError('the output of {} is already piped '
+                                     'elsewhere'.format(session.session))
+            # -o leaves a pipe opened since the check alone
+            self._pipe_pane("exec cat > '{}'".format(self._fifo), '-o')
+        except Exception:
+            self._cleanup()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.get()
+        if line is None:
+            raise StopIteration
+        return line
+
+    next = __next__  # Python 2
+
+    def get(self, timeout=None):
+        """Return the next line, waiting up to ``timeout`` seconds for it (or
+        forever, if ``timeout`` is ``None``). Return ``None`` if no line
+        arrived in time or the stream is closed."""
+        deadline = None if timeout is None else _clock() + timeout
+        with self._condition:
+            while not self._pending and not self.closed:
+                if deadline is None:
+                    self._condition.wait()
+                else:
+                    remaining = deadline - _clock()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            if not self._pending:
+                return None
+            line = self._pending.popleft()
+            self._condition.notify_all()
+            return line
+
+    def recent(self):
+        """Return a list of the most recent lines, oldest first, including
+        lines that have already been read."""
+        with self._condition:
+            return list(self._history)
+
+    def close(self):
+        """Stop copying the session's output and end iteration."""
+        if self.closed:
+            return
+        try:
+            self._pipe_pane()
+        except subprocess.CalledProcessError:
+            pass  # the pane is gone, and its pipe with it
+        finally:
+            self._cleanup()
+
+    def _cleanup(self):
+        self._stop.set()
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+        self._reader.join()
+        os.close(self._fd)
+        shutil.rmtree(self._directory, ignore_errors=True)
+
+    def _pipe_pane(self, command=None, *flags):
+        args = oraide._tmux_command(self.session.socket_name, 'pipe-pane',
+                                    '-t{}'.format(self.session.session))
+        args.extend(flags)
+        if command is not None:
+            args.append(command)
+        oraide._tmux(args, self.session.session, self.session.socket_name)
+
+    def _piped(self):
+        args = oraide._tmux_command(self.session.socket_name,
+                                    'display-message', '-p',
+                                    '-t{}'.format(self.session.session),
+                                    '#{pane_pipe}')
+        out = oraide._tmux(args, self.session.session,
+                           self.session.socket_name)
+        return out.strip() == b'1'
+
+    def _read(self):
+        decoder = codecs.getincrementaldecoder(oraide._encoding)('replace')
+        partial = u''
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._fd], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._fd, 65536)
+            except OSError as exc:
+                if exc.errno == errno.EAGAIN:
+                    continue
+                raise
+
+            lines = (partial + decoder.decode(data)).split(u'\n')
+            partial = lines.pop()
+            if self.strip_escapes:
+                # a carriage return starts the line again, except perhaps
+                # one that ends the data, before the newline of a CRLF
+                partial = partial[partial.rfind(u'\r', 0, -1) + 1:]
+            partial = partial[-MAX_PARTIAL_LINE:]
+            for line in lines:
+                self._append(line)
+
+    def _append(self, line):
+        line = line.rstrip(u'\r')
+        if self.strip_escapes:
+            line = ESCAPE_PATTERN.sub(u'', line)
+            line = line[line.rfind(u'\r') + 1:]
+
+        with self._condition:
+            self._history.append(line)
+            if len(self._pending) >= self.buffer_size:
+                if self.overflow == 'drop-newest':
+                    self.dropped += 1
+                    return
+                elif self.overflow == 'drop-oldest':
+                    self._pending.popleft()
+                    self.dropped += 1
+                else:
+                    while (len(self._pending) >= self.buffer_size and
+                           not self._stop.is_set()):
+                        self._condition.wait(0.1)
+            self._pending.append(line)
+            self._condition.notify_all()
+
+
+__all__ = ['OutputStream', 'PipeInUseError']
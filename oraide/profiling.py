@@ -0,0 +1,244 @@
+"""This module measures where the time goes in a scripted demonstration. Run a
+script under the profiler from the command line:
+
+.. code-block:: console
+
+   $ python -m oraide profile --flamegraph demo.folded my_demo.py
+
+When the script finishes, a table of steps is printed. Each step is a call to
+one of :class:`oraide.Session`'s methods, and its time is split into these
+categories:
+
+``sleep``
+    delays between keystrokes (see :meth:`oraide.Session.teletype`)
+``fork/exec``
+    starting ``tmux`` client processes
+``tmux reply``
+    waiting for the tmux server to handle each command, whether it was sent
+    by a client process or over a control mode connection (see
+    :mod:`oraide.control`)
+``presenter wait``
+    waiting at a prompt for the presenter to press :kbd:`Enter`
+``other``
+    everything else, such as Python overhead and the script's own work
+
+The optional flame graph file uses the "folded" format understood by
+`FlameGraph`_ and `speedscope`_, with times in microseconds.
+
+.. _FlameGraph: https://github.com/brendangregg/FlameGraph
+.. _speedscope: https://www.speedscope.app/
+"""
+
+from __future__ import print_function
+
+import io
+import os
+import runpy
+import sys
+import threading
+import time
+from functools import wraps
+
+import oraide
+
+CATEGORIES = ('sleep', 'fork/exec', 'tmux reply', 'presenter wait')
+STEP_METHODS = ('send_keys', 'send_literal_char', 'teletype',
+                'teletype_stream', 'enter', 'enter_stream', 'screen')
+NO_STEP = '(outside steps)'
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class StepTimes(object):
+    """The time spent in one step, in seconds, in total and by category."""
+
+    def __init__(self, number, name):
+        self.number = number
+        self.name = name
+        self.total = 0.0
+        self.categories = dict((category, 0.0) for category in CATEGORIES)
+
+    @property
+    def other(self):
+        """The time spent in the step outside any category."""
+        return max(self.total - sum(self.categories.values()), 0.0)
+
+
+class Profiler(object):
+    """A context manager that instruments oraide while it is active. For
+    example:
+
+    .. code-block:: python
+
+       with Profiler() as profiler:
+           session.enter('make')
+       profiler.report()
+    """
+
+    def __init__(self):
+        self.steps = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._originals = {}
+        self._no_step = None
+        self._count = 0
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
+
+    def install(self):
+        """Replace oraide's internals with timed versions."""
+        self._patch(oraide, '_sleep', self._timed('sleep', oraide._sleep))
+        self._patch(oraide, '_spawn', self._timed('fork/exec', oraide._spawn))
+        self._patch(oraide, '_reply', self._timed('tmux reply', oraide._reply))
+        self._patch(oraide, '_execute',
+                    self._timed('tmux reply', oraide._execute))
+        self._patch(oraide, '_input',
+                    self._timed('presenter wait', oraide._input))
+        for name in STEP_METHODS:
+            self._patch(oraide.Session, name,
+                        self._step(name, oraide.Session.__dict__[name]))
+
+    def uninstall(self):
+        """Restore oraide's original internals."""
+        for (owner, name), original in self._originals.items():
+            setattr(owner, name, original)
+        self._originals.clear()
+
+    def report(self, stream=None):
+        """Print a table of the time spent in each step, in milliseconds."""
+        stream = stream if stream is not None else sys.stdout
+        columns = CATEGORIES + ('other', 'total')
+        row = u'{:<40}' + u'{:>15}' * len(columns)
+
+        print(row.format(u'step', *columns), file=stream)
+        totals = StepTimes(None, u'all steps')
+        for step in self.steps:
+            print(self._row(row, step), file=stream)
+            totals.total += step.total
+            for category in CATEGORIES:
+                totals.categories[category] += step.categories[category]
+        print(self._row(row, totals), file=stream)
+
+    def folded(self, root='oraide'):
+        """Return the profile as lines in the folded flame graph format."""
+        lines = []
+        for step in self.steps:
+            frames = u'{};{}'.format(_frame(root), _frame(self._label(step)))
+            for category in CATEGORIES + ('other',):
+                value = (step.other if category == 'other'
+                         else step.categories[category])
+                micros = int(round(value * 1e6))
+                if micros:
+                    lines.append(u'{};{} {}'.format(frames, category, micros))
+        return lines
+
+    def _row(self, row, step):
+        label = self._label(step)
+        if len(label) > 39:
+            label = label[:36] + u'...'
+        values = [step.categories[category] for category in CATEGORIES]
+        values += [step.other, step.total]
+        return row.format(label, *[u'{:.1f}'.format(value * 1000)
+                                   for value in values])
+
+    def _label(self, step):
+        if step.number is None:
+            return step.name
+        return u'{} {}'.format(step.number, step.name)
+
+    def _patch(self, owner, name, replacement):
+        self._originals[(owner, name)] = getattr(owner, name)
+        setattr(owner, name, replacement)
+
+    def _current(self):
+        step = getattr(self._local, 'step', None)
+        if step is None:
+            with self._lock:
+                if self._no_step is None:
+                    self._no_step = StepTimes(None, NO_STEP)
+                    self.steps.append(self._no_step)
+            step = self._no_step
+        return step
+
+    def _timed(self, category, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = _clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = _clock() - start
+                step = self._current()
+                with self._lock:
+                    step.categories[category] += elapsed
+                    if step is self._no_step:
+                        step.total += elapsed
+        return wrapper
+
+    def _step(self, name, func):
+        @wraps(func)
+        def wrapper(session, *args, **kwargs):
+            if getattr(self._local, 'step', None) is not None:
+                return func(session, *args, **kwargs)
+
+            description = u'[{}] {}'.format(session.session, name)
+            if args:
+                description += u' {!r}'.format(args[0])
+            with self._lock:
+                self._count += 1
+                step = StepTimes(self._count, description)
+                self.steps.append(step)
+
+            self._local.step = step
+            start = _clock()
+            try:
+                return func(session, *args, **kwargs)
+            finally:
+                step.total = _clock() - start
+                self._local.step = None
+        return wrapper
+
+
+def _frame(name):
+    return name.replace(u';', u':').replace(u'\n', u' ')
+
+
+def run_script(path, args=(), flamegraph=None, stream=None):
+    """Run the Python script at ``path`` under a :class:`Profiler`, then
+    print its report.
+
+    :param path: the path of the script to run
+    :param args: command-line arguments for the script
+    :param flamegraph: the path of a file in which to save the profile in the
+        folded flame graph format
+    :param stream: the file to which to print the report (defaults to
+        standard output)
+    """
+    original_argv = sys.argv
+    sys.argv = [path] + list(args)
+    profiler = Profiler()
+    try:
+        with profiler:
+            try:
+                runpy.run_path(path, run_name='__main__')
+            except SystemExit as exc:
+                if exc.code not in (None, 0):
+                    raise
+    finally:
+        sys.argv = original_argv
+        profiler.report(stream)
+        if flamegraph:
+            root = os.path.basename(path)
+            with io.open(flamegraph, 'w', encoding='utf-8') as fp:
+                for line in profiler.folded(root=root):
+                    fp.write(line + u'\n')
+
+    return profiler
+
+
+__all__ = ['Profiler', 'run_script']
@@ -0,0 +1,513 @@
+"""This module drives tmux on other machines. Run an agent next to tmux on
+each machine:
+
+.. code-block:: console
+
+   $ export ORAIDE_AGENT_TOKEN=some-shared-secret
+   $ python -m oraide agent --port 7397
+
+Then use a :class:`RemoteSession` on the controlling machine (with the same
+``ORAIDE_AGENT_TOKEN``), naming the session as ``host:session``:
+
+.. code-block:: python
+
+   from oraide.remote import RemoteSession
+
+   session = RemoteSession('lab3.example.com:demo', enable_auto_advance=True)
+   session.enter('make test')
+   session.flush()
+
+A :class:`RemoteSession` works like a :class:`oraide.Session`. Typing is
+still paced on the controller, but keystrokes are pipelined: each one is sent
+without waiting for the previous one to be acknowledged, so the network's
+round-trip time is paid once, not once per keystroke. When keystrokes queue up
+faster than the connection can carry them, consecutive keystrokes for the same
+session are merged into a single request. Errors from pipelined keystrokes
+(such as a missing session) are raised by the next call on the session, or by
+:meth:`RemoteSession.flush`.
+
+Every session on the same agent shares one connection (see :func:`connect`).
+The agent runs each connection's requests in the order they arrive, and sends
+commands to tmux over a control mode connection (see :mod:`oraide.control`).
+
+.. warning::
+
+   Anyone who can connect to an agent can type into its tmux sessions. The
+   agent listens only on the loopback interface unless told otherwise, and
+   refuses to start without a token (from ``ORAIDE_AGENT_TOKEN``), which
+   every controller must present. Across untrusted networks, reach the agent
+   through an SSH tunnel, since the token is sent in the clear.
+"""
+
+import base64
+import hmac
+import json
+import logging
+import os
+import socket
+import subprocess
+import threading
+from itertools import count
+
+try:
+    import queue
+    import socketserver
+except ImportError:  # Python 2
+    import Queue as queue
+    import SocketServer as socketserver
+
+import oraide
+from oraide import (Cancelled, ConnectionFailedError, SessionNotFoundError,
+                    Session, control)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 7397
+AGENT_OPS = ('send_keys', 'teletype', 'capture')
+
+
+class RemoteError(RuntimeError):
+    """A request to an agent failed for a reason other than a tmux error, the
+    connection to the agent was lost, or the request can't be made remotely
+    (such as streaming a remote session's output)."""
+
+
+def _token(token):
+    if token is None:
+        token = os.environ.get('ORAIDE_AGENT_TOKEN')
+    return token
+
+
+def _encode(message):
+    return (json.dumps(message) + '\n').encode('utf-8')
+
+
+def _nodelay(sock):
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class _AgentHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        _nodelay(self.connection)
+        agent = self.server.oraide_agent
+        authenticated = False
+
+        try:
+            self._serve(agent, authenticated)
+        except (IOError, OSError):
+            pass  # the controller went away
+
+    def _serve(self, agent, authenticated):
+        for line in iter(self.rfile.readline, b''):
+            problem = None
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError as exc:
+                request, problem = {}, str(exc)
+            if not isinstance(request, dict):
+                request, problem = {}, 'a request must be a JSON object'
+            reply = {'id': request.get('id'), 'ok': True}
+            if request.get('op') == 'hello':
+                authenticated = agent.check_token(request.get('token'))
+            if not authenticated:
+                logger.warning('Refused %s: bad token', self.client_address)
+                reply.update(ok=False, type='RemoteError',
+                             message='authentication failed')
+                self.wfile.write(_encode(reply))
+                return
+            if problem is not None:
+                reply.update(ok=False, type='ValueError', message=problem)
+                self.wfile.write(_encode(reply))
+                continue
+
+            try:
+                reply['result'] = agent.execute(request)
+            except subprocess.CalledProcessError as exc:
+                reply.update(ok=False, type=type(exc).__name__,
+                             message=str(exc), returncode=exc.returncode,
+                             cmd=exc.cmd, session=request.get('session'),
+                             output=(exc.output or b'').decode(
+                                 oraide._encoding, 'replace'))
+            except Exception as exc:
+                logger.exception('Request %r failed', request.get('op'))
+                reply.update(ok=False, type=type(exc).__name__,
+                             message=str(exc))
+            self.wfile.write(_encode(reply))
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class Agent(object):
+    """A server that runs oraide's commands for remote controllers, on the
+    machine where tmux runs.
+
+    :param host: the address on which to listen
+    :param int port: the port on which to listen (``0`` picks a free port)
+    :param token: the secret controllers must present (by default, the value
+        of the ``ORAIDE_AGENT_TOKEN`` environment variable); raises
+        :exc:`ValueError` if there is none
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, token=None):
+        self.token = _token(token)
+        if not self.token:
+            raise ValueError('the agent needs a token; set '
+                             'ORAIDE_AGENT_TOKEN')
+        self.server = _TCPServer((host, port), _AgentHandler)
+        self.server.oraide_agent = self
+        self.host, self.port = self.server.server_address[:2]
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def check_token(self, token):
+        """Return whether ``token`` matches the agent's token."""
+        if not isinstance(token, type(u'')):
+            return False
+        return hmac.compare_digest(
+            self.token.encode('utf-8'), token.encode('utf-8'))
+
+    def execute(self, request):
+        """Run one request and return its result."""
+        op = request.get('op')
+        if op in ('hello', 'ping'):
+            return None
+        if op not in AGENT_OPS:
+            raise ValueError('unknown op: {!r}'.format(op))
+
+        session = self.session(request['session'],
+                               request.get('socket_name'))
+        if op == 'send_keys':
+            oraide.send_keys(session.session, request['keys'],
+                             literal=request.get('literal', True),
+                             socket_name=session.socket_name)
+            return None
+        if op == 'teletype':
+            session.teletype(request['keys'], delay=request.get('delay'),
+                             burst=request.get('burst'))
+            return None
+        if op == 'capture':
+            output = oraide.capture_pane(
+                session.session, start=request.get('start'),
+                end=request.get('end'), escapes=request.get('escapes', False),
+                socket_name=session.socket_name)
+            return base64.b64encode(output).decode('ascii')
+
+    def session(self, name, socket_name=None):
+        """Return the agent's :class:`oraide.Session` for a session,
+        connecting to its tmux server in control mode on first use."""
+        key = (socket_name, name)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = Session(
+                    name, enable_auto_advance=True, socket_name=socket_name)
+        if socket_name not in oraide._control_clients:
+            try:
+                control.connect(socket_name, target=name)
+            except ConnectionFailedError:
+                pass  # commands fall back to starting tmux
+        return session
+
+    def serve_forever(self):
+        """Handle requests until :meth:`shutdown` is called."""
+        logger.info('Listening on %s:%s', self.host, self.port)
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def shutdown(self):
+        """Stop :meth:`serve_forever` (from another thread)."""
+        self.server.shutdown()
+
+    def close(self):
+        """Stop listening, and disconnect from tmux."""
+        self.server.server_close()
+        with self._lock:
+            socket_names = set(key[0] for key in self._sessions)
+            self._sessions = {}
+        for socket_name in socket_names:
+            control.disconnect(socket_name)
+
+
+class _Call(object):
+    def __init__(self, detached=False):
+        self.detached = detached
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def _error(reply):
+    """Rebuild the exception an agent reported."""
+    kind = reply.get('type')
+    if 'returncode' in reply:
+        args = (reply['returncode'], reply['cmd'],
+                reply.get('output', u'').encode(oraide._encoding))
+        if kind == 'SessionNotFoundError':
+            return SessionNotFoundError(*args, session=reply.get('session'))
+        if kind in ('ConnectionFailedError', 'CircuitOpenError'):
+            return ConnectionFailedError(*args)
+        return subprocess.CalledProcessError(*args)
+    if kind == 'Cancelled':
+        return Cancelled()
+    return RemoteError('{}: {}'.format(kind, reply.get('message')))
+
+
+def _coalesce(items):
+    """Merge runs of literal ``send_keys`` requests for the same session into
+    single requests. Return a list of ``(request, calls)`` pairs."""
+    merged = []
+    for request, call in items:
+        if merged and request['op'] == 'send_keys' and request['literal']:
+            last, calls = merged[-1]
+            if (last['op'] == 'send_keys' and last['literal'] and
+                    last['session'] == request['session'] and
+                    last['socket_name'] == request['socket_name']):
+                last = dict(last, keys=last['keys'] + request['keys'])
+                merged[-1] = (last, calls + [call])
+                continue
+        merged.append((request, [call]))
+    return merged
+
+
+class Node(object):
+    """A pipelined connection to an agent. Use :func:`connect` to get one.
+
+    :param host: the agent's address
+    :param int port: the agent's port
+    :param token: the agent's token (by default, the value of the
+        ``ORAIDE_AGENT_TOKEN`` environment variable, if set)
+    """
+
+    def __init__(self, host, port=DEFAULT_PORT, token=None):
+        self.host = host
+        self.port = port
+        self.closed = False
+        self._outbox = queue.Queue()
+        self._waiting = {}
+        self._errors = []
+        self._ids = count()
+        self._lock = threading.Lock()
+
+        self._sock = socket.create_connection((host, port))
+        _nodelay(self._sock)
+        self._sock.sendall(_encode({'op': 'hello', 'id': None,
+                                    'token': _token(token)}))
+        self._reader_file = self._sock.makefile('rb')
+        reply = json.loads(self._reader_file.readline().decode('utf-8')
+                           or '{}')
+        if not reply.get('ok'):
+            self._sock.close()
+            raise RemoteError('could not connect to agent at {}:{}: {}'.format(
+                host, port, reply.get('message', 'connection closed')))
+
+        self._writer = threading.Thread(target=self._write)
+        self._reader = threading.Thread(target=self._read)
+        for thread in (self._writer, self._reader):
+            thread.daemon = True
+            thread.start()
+
+    def send(self, session, keys, literal=True, socket_name=None):
+        """Send keys without waiting for the agent to acknowledge them."""
+        self.check()
+        self._submit({'op': 'send_keys', 'session': session, 'keys': keys,
+                      'literal': literal, 'socket_name': socket_name},
+                     _Call(detached=True))
+
+    def call(self, op, **params):
+        """Send a request after any keys already sent, wait for its reply,
+        and return the result."""
+        self.check()
+        call = _Call()
+        params['op'] = op
+        self._submit(params, call)
+        return call.wait()
+
+    def flush(self):
+        """Wait until every request sent so far is done, then raise the first
+        error from any of them, if there was one."""
+        self.call('ping')
+        self.check()
+
+    def check(self):
+        """Raise the first error from a request sent with :meth:`send`, if
+        one has failed since the last check."""
+        with self._lock:
+            if self._errors:
+                error, self._errors = self._errors[0], []
+                raise error
+            if self.closed:
+                raise RemoteError('the connection to the agent at {}:{} is '
+                                  'closed'.format(self.host, self.port))
+
+    def close(self):
+        """Close the connection, once every request already sent is
+        done."""
+        if not self.closed:
+            call = _Call()
+            self._submit({'op': 'ping'}, call)
+            call.event.wait()
+        self._outbox.put(None)
+        self._writer.join()
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except (IOError, OSError):
+            pass
+        self._reader.join()
+        self._sock.close()
+
+    def _submit(self, request, call):
+        self._outbox.put((request, call))
+
+    def _lost(self):
+        return RemoteError('lost the connection to the agent at '
+                           '{}:{}'.format(self.host, self.port))
+
+    def _write(self):
+        stopping = False
+        while not stopping:
+            items = [self._outbox.get()]
+            while True:
+                try:
+                    items.append(self._outbox.get_nowait())
+                except queue.Empty:
+                    break
+            if None in items:
+                stopping = True
+                items = items[:items.index(None)]
+
+            data = []
+            with self._lock:
+                closed = self.closed
+                if not closed:
+                    for request, calls in _coalesce(items):
+                        request['id'] = next(self._ids)
+                        self._waiting[request['id']] = calls
+                        data.append(_encode(request))
+            if closed:
+                self._resolve([call for _, call in items], None, self._lost())
+                continue
+            try:
+                self._sock.sendall(b''.join(data))
+            except (IOError, OSError):
+                pass  # the reader fails the requests when it notices
+
+    def _read(self):
+        try:
+            for line in iter(self._reader_file.readline, b''):
+                reply = json.loads(line.decode('utf-8'))
+                with self._lock:
+                    calls = self._waiting.pop(reply.get('id'), [])
+                error = None if reply.get('ok') else _error(reply)
+                self._resolve(calls, reply.get('result'), error)
+        except (IOError, OSError):
+            pass
+
+        with self._lock:
+            self.closed = True
+            waiting, self._waiting = self._waiting, {}
+        error = self._lost()
+        for calls in waiting.values():
+            self._resolve(calls, None, error)
+        with _nodes_lock:
+            if _nodes.get((self.host, self.port)) is self:
+                del _nodes[(self.host, self.port)]
+
+    def _resolve(self, calls, result, error):
+        for call in calls:
+            call.result = result
+            call.error = error
+            if error is not None and call.detached:
+                with self._lock:
+                    self._errors.append(error)
+            call.event.set()
+
+
+_nodes = {}
+_nodes_lock = threading.Lock()
+
+
+def connect(host, port=DEFAULT_PORT, token=None):
+    """Return the shared :class:`Node` for an agent, connecting to it if
+    necessary.
+
+    :param host: the agent's address
+    :param int port: the agent's port
+    :param token: the agent's token
+    """
+    with _nodes_lock:
+        node = _nodes.get((host, port))
+        if node is None or node.closed:
+            node = _nodes[(host, port)] = Node(host, port, token=token)
+        return node
+
+
+class RemoteSession(Session):
+    """A session on another machine, reached through its agent. Use it like
+    an :class:`oraide.Session`.
+
+    :param target: the agent's address and the session's name, as
+        ``host:session``
+    :param int port: the agent's port
+    :param token: the agent's token
+    :param node: a :class:`Node` to use instead of the shared one
+
+    The other parameters are the same as :class:`oraide.Session`'s; the
+    ``socket_name`` is that of the tmux server on the remote machine.
+    """
+
+    def __init__(self, target, port=DEFAULT_PORT, token=None, node=None,
+                 **kwargs):
+        host, _, name = target.rpartition(':')
+        if not host:
+            raise ValueError('expected host:session, not {!r}'.format(target))
+        self.host = host.strip('[]')
+        self.node = node if node is not None else connect(self.host, port,
+                                                          token=token)
+        super(RemoteSession, self).__init__(name, **kwargs)
+
+    def _compile(self):
+        pass  # commands are built by the agent
+
+    def send_keys(self, keys, literal=True):
+        """Send keys to the session, without waiting for them to arrive.
+
+        :param keys: keystrokes to send to the session
+        :param literal: whether to prevent tmux from looking up keynames
+        """
+        self.node.send(self.session, keys, literal=literal,
+                       socket_name=self.socket_name)
+
+    def send_literal_char(self, key):
+        """Send a single literal keystroke, without waiting for it to
+        arrive."""
+        self.node.send(self.session, key, socket_name=self.socket_name)
+
+    def flush(self):
+        """Wait until every keystroke sent so far has been typed, and raise
+        the first error from any of them."""
+        self.node.flush()
+
+    def output(self, *args, **kwargs):
+        # the agent has no way to stream a pane's output back
+        raise RemoteError('the output of a remote session cannot be '
+                          'streamed; use screen() instead')
+
+    def _capture(self, start, end, escapes):
+        output = self.node.call('capture', session=self.session,
+                                socket_name=self.socket_name, start=start,
+                                end=end, escapes=escapes)
+        return base64.b64decode(output.encode('ascii'))
+
+
+__all__ = ['Agent', 'connect', 'Node', 'RemoteError', 'RemoteSession']
@@ -0,0 +1,224 @@
+"""This module compiles a demonstration ahead of time, so that its length is
+known before it runs. A :class:`Script` has the same methods as
+:class:`oraide.Session`, but instead of sending keystrokes it records them
+(and the delays between them) as a flat list of operations:
+
+.. code-block:: python
+
+   from oraide import keys, Session
+   from oraide.script import Script
+
+   script = Script(Session('demo'))
+   script.enter('cd project')
+   script.teletype('vim README', delay=120)
+   script.send_keys(keys.enter, literal=False)
+   script.sleep(2)
+   script.checkpoint('editor')
+
+   print(script.estimate())
+   script.run()
+
+The random variation in typing speed is drawn when each step is compiled, so
+:meth:`Script.estimate` can report both the length of this particular run and
+the range that any run of the same steps falls within. Key names sent with
+``literal`` set to ``False`` are checked with :func:`oraide.keys.is_keyname`
+as each step is compiled, so a typo fails at once instead of partway through
+a talk.
+
+Running a compiled script sends each operation in turn, using
+:meth:`oraide.Session.send_literal_char` for typed characters, without
+recomputing delays, bursts, or prompts.
+"""
+
+from __future__ import division
+
+import random
+from collections import namedtuple
+from contextlib import contextmanager
+
+import oraide
+from oraide import keys as keyboard
+
+SEND = 'send'
+KEYS = 'keys'
+SLEEP = 'sleep'
+WAIT = 'wait'
+CHECKPOINT = 'checkpoint'
+
+Op = namedtuple('Op', 'kind value seconds shortest longest')
+Op.__doc__ = """One compiled operation: send literal keys (``send``), send a
+key name (``keys``), sleep for ``seconds`` (``sleep``), wait for the
+presenter (``wait``), or reach a checkpoint (``checkpoint``). For sleeps,
+``shortest`` and ``longest`` are the bounds from which ``seconds`` was
+drawn."""
+
+Estimate = namedtuple('Estimate', 'planned expected shortest longest waits')
+Estimate.__doc__ = """The length of a compiled script, in seconds: as planned
+(with the delays drawn when it was compiled), on average, and at least and at
+most, not counting the ``waits`` for the presenter."""
+
+
+class Script(object):
+    """A compiled sequence of steps for one session.
+
+    Delays and bursts default to the session's ``teletype_delay`` and
+    ``teletype_burst``, and steps wait for the presenter unless the session's
+    ``enable_auto_advance`` is set, exactly as when calling the session's
+    methods directly.
+
+    :param session: the :class:`oraide.Session` the script will run in
+    :param seed: a seed for the random variation in typing speed, to compile
+        the same timing every time
+    """
+
+    def __init__(self, session, seed=None):
+        self.session = session
+        self.ops = []
+        self.auto_advancing = session.enable_auto_advance
+        self._random = random.Random(seed)
+
+    def send_keys(self, keys, literal=True):
+        """Compile :meth:`oraide.Session.send_keys`. Raises
+        :exc:`ValueError` if ``literal`` is ``False`` and ``keys`` is not a
+        key name."""
+        self._check(keys, literal)
+        self._wait(keys)
+        self._send(keys, literal)
+
+    def teletype(self, keys, delay=None, burst=None):
+        """Compile :meth:`oraide.Session.teletype`."""
+        self._wait(keys)
+        self._teletype(keys, delay, burst)
+
+    def enter(self, keys=None, teletype=True, after=keyboard.enter):
+        """Compile :meth:`oraide.Session.enter`."""
+        if after:
+            self._check(after, False)
+        self._wait(keys)
+        if keys:
+            if teletype:
+                self._teletype(keys, None, None)
+            else:
+                self._send(keys, True)
+        if after:
+            self._send(after, False)
+
+    def sleep(self, seconds):
+        """Pause for ``seconds``."""
+        self.ops.append(Op(SLEEP, None, seconds, seconds, seconds))
+
+    def pause(self):
+        """Wait for the presenter to press :kbd:`Enter`, even when
+        auto-advancing."""
+        self.ops.append(Op(WAIT, u'[{}] Press enter to continue'.format(
+            self.session.session), 0, 0, 0))
+
+    def checkpoint(self, label=None):
+        """Compile :meth:`oraide.Session.checkpoint`."""
+        self.ops.append(Op(CHECKPOINT, label, 0, 0, 0))
+
+    @contextmanager
+    def auto_advance(self):
+        """Compile the steps inside the block without waiting for the
+        presenter, like :meth:`oraide.Session.auto_advance`."""
+        initial_auto_state = self.auto_advancing
+        self.auto_advancing = True
+        try:
+            yield
+        finally:
+            self.auto_advancing = initial_auto_state
+
+    def estimate(self, send_seconds=0.0):
+        """Return an :class:`Estimate` of the script's length.
+
+        :param send_seconds: the time each tmux command takes, to include in
+            the estimate (``python -m oraide profile`` measures it)
+        """
+        planned = expected = shortest = longest = 0.0
+        waits = 0
+        for op in self.ops:
+            if op.kind == SLEEP:
+                planned += op.seconds
+                expected += (op.shortest + op.longest) / 2
+                shortest += op.shortest
+                longest += op.longest
+            elif op.kind == WAIT:
+                waits += 1
+            elif op.kind != CHECKPOINT:
+                planned += send_seconds
+                expected += send_seconds
+                shortest += send_seconds
+                longest += send_seconds
+        return Estimate(planned, expected, shortest, longest, waits)
+
+    def run(self):
+        """Run the compiled operations in the session.
+
+        Checkpoints and fast-forwarding work as in :class:`oraide.Session`:
+        while fast-forwarding, sleeps and waits are skipped. The session's
+        :meth:`~oraide.Session.pause`, :meth:`~oraide.Session.resume`, and
+        :meth:`~oraide.Session.cancel` take effect between operations and
+        during sleeps.
+        """
+        session = self.session
+        send = session.send_literal_char
+        flow = session._flow
+        with flow.typing():
+            for op in self.ops:
+                kind = op.kind
+                flow.check()
+                if kind == SEND:
+                    send(op.value)
+                elif kind == SLEEP:
+                    if not session.fast_forwarding:
+                        oraide._sleep(op.seconds, flow)
+                elif kind == KEYS:
+                    session.send_keys(op.value, literal=False)
+                elif kind == WAIT:
+                    if not session.fast_forwarding:
+                        oraide._input(op.value)
+                else:
+                    session.checkpoint(op.value)
+
+    def _wait(self, keys):
+        if self.auto_advancing:
+            return
+        if keys is not None:
+            msg = u'[{}] Press enter to send {!r}'.format(
+                self.session.session, keys)
+        else:
+            msg = u'[{}] Press enter to continue'.format(self.session.session)
+        self.ops.append(Op(WAIT, msg, 0, 0, 0))
+
+    def _check(self, keys, literal):
+        if not literal and not keyboard.is_keyname(keys):
+            raise ValueError('unknown key name: {!r}'.format(keys))
+
+    def _send(self, keys, literal):
+        self.ops.append(Op(SEND if literal else KEYS, keys, 0, 0, 0))
+
+    def _teletype(self, keys, delay, burst):
+        session = self.session
+        if delay is None:
+            delay = (session.teletype_delay
+                     if session.teletype_delay is not None else 90)
+        if burst is None:
+            burst = session.teletype_burst if session.teletype_burst else 1
+
+        delay_variation = delay // 10
+        shortest = delay - delay_variation
+        longest = delay + delay_variation
+        randint = self._random.randint
+        append = self.ops.append
+
+        if burst <= 1:
+            bursts = ((key, 1) for key in keys)
+        else:
+            bursts = oraide._iter_bursts(keys, burst)
+        for keys_burst, length in bursts:
+            append(Op(SEND, keys_burst, 0, 0, 0))
+            append(Op(SLEEP, None, randint(shortest, longest) * length / 1e3,
+                      shortest * length / 1e3, longest * length / 1e3))
+
+
+__all__ = ['Estimate', 'Op', 'Script']
@@ -0,0 +1,89 @@
+"""This module starts private tmux servers, each on its own socket, so that
+oraide can open as many sessions as it needs without disturbing your own.
+:mod:`oraide.stress` measures scaling on one, and :mod:`oraide.cluster` shards
+sessions across several:
+
+.. code-block:: python
+
+   from oraide import Session
+   from oraide.server import PrivateServer
+
+   with PrivateServer(['demo'], command=None) as server:
+       session = Session('demo', socket_name=server.socket_name)
+       session.enter('ls')
+"""
+
+from __future__ import division
+
+import os
+import subprocess
+import uuid
+
+import oraide
+
+
+class PrivateServer(object):
+    """A tmux server on its own socket, with a number of detached sessions.
+    Use it as a context manager to kill the server when finished.
+
+    :param sessions: the number of sessions to start, or a list of their
+        names
+    :param command: the command to run in each session (by default, one that
+        discards everything typed into it), or ``None`` for a shell
+    :param socket_name: the name of the server's socket (by default, a new
+        random name)
+    """
+
+    def __init__(self, sessions, command='cat > /dev/null', socket_name=None):
+        self.socket_name = socket_name or 'oraide-private-{}'.format(
+            uuid.uuid4().hex[:8])
+        if isinstance(sessions, int):
+            sessions = ['session{}'.format(i) for i in range(sessions)]
+        self.sessions = list(sessions)
+        self.command = command
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.kill()
+
+    def start(self):
+        """Start the server and its sessions."""
+        oraide.server_health(self.socket_name).reset()
+        for session in self.sessions:
+            args = self._command('new-session', '-d', '-s{}'.format(session))
+            if self.command is not None:
+                args.append(self.command)
+            subprocess.check_call(args)
+
+    def kill(self):
+        """Stop the server, closing its sessions."""
+        proc = subprocess.Popen(self._command('kill-server'),
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT)
+        proc.communicate()
+
+    def pid(self):
+        """Return the process ID of the server."""
+        output = subprocess.check_output(
+            self._command('display-message', '-p', '#{pid}'))
+        return int(output.strip())
+
+    def cpu_seconds(self):
+        """Return the CPU time used by the server so far, or ``None`` if it
+        cannot be determined on this platform."""
+        try:
+            with open('/proc/{}/stat'.format(self.pid())) as fp:
+                fields = fp.read().rsplit(')', 1)[1].split()
+        except (IOError, OSError, ValueError, subprocess.CalledProcessError):
+            return None
+        utime, stime = int(fields[11]), int(fields[12])
+        return (utime + stime) / os.sysconf('SC_CLK_TCK')
+
+    def _command(self, *args):
+        return oraide._tmux_command(self.socket_name, *args)
+
+
+__all__ = ['PrivateServer']
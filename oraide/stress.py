@@ -0,0 +1,311 @@
+"""This module measures how oraide scales as the number of sessions grows. It
+starts a private tmux server (so it never disturbs your own sessions), opens
+``N`` sessions on it, sends keystrokes to all of them at once, and reports
+throughput, latency percentiles, the tmux server's CPU use, and the failure
+rate. Run it from the command line:
+
+.. code-block:: console
+
+   $ python -m oraide stress --sessions 1,2,4,8,16,32 --mode threads
+
+Each line of output is one point on the scaling curve. Use ``--csv`` to save
+the curve for comparison between releases.
+
+Three modes of concurrency are available: ``threads`` and ``processes`` split
+the sessions among a pool of workers, each of which drives its sessions in
+turn; ``select`` drives every session from a single thread, starting tmux
+clients without waiting for them and watching their output pipes (with
+:mod:`selectors`, or :func:`select.poll` on Python 2), so that at most
+``--concurrency`` clients run at once.
+"""
+
+from __future__ import division, print_function
+
+import csv
+import math
+import os
+import select
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+try:
+    import selectors
+except ImportError:  # Python 2
+    selectors = None
+
+import oraide
+from oraide.server import PrivateServer
+
+MODES = ('threads', 'processes', 'select')
+FIELDS = ('sessions', 'mode', 'concurrency', 'sends', 'failures',
+          'failure_rate', 'seconds', 'throughput', 'p50_ms', 'p90_ms',
+          'p99_ms', 'max_ms', 'server_cpu')
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+def percentile(values, fraction):
+    """Return the value at ``fraction`` (between 0 and 1) of the sorted
+    ``values``, using the nearest-rank method."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = int(math.ceil(fraction * len(ordered))) - 1
+    return ordered[min(max(rank, 0), len(ordered) - 1)]
+
+
+def drive(socket_name, sessions, keystrokes):
+    """Send ``keystrokes`` characters, one at a time, to each of
+    ``sessions`` in turn. Return the latency of each successful send, in
+    seconds, and the number of failed sends."""
+    latencies = []
+    failures = 0
+    for index in range(keystrokes):
+        key = chr(ord('a') + index % 26)
+        for session in sessions:
+            start = _clock()
+            try:
+                oraide.send_keys(session, key, socket_name=socket_name)
+            except subprocess.CalledProcessError:
+                failures += 1
+            else:
+                latencies.append(_clock() - start)
+    return latencies, failures
+
+
+def _drive_args(args):
+    return drive(*args)
+
+
+def _run_threads(socket_name, groups, keystrokes):
+    results = [None] * len(groups)
+
+    def work(index, group):
+        results[index] = drive(socket_name, group, keystrokes)
+
+    threads = [threading.Thread(target=work, args=(index, group))
+               for index, group in enumerate(groups)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _run_processes(socket_name, groups, keystrokes):
+    import multiprocessing
+    pool = multiprocessing.Pool(len(groups))
+    try:
+        return pool.map(_drive_args,
+                        [(socket_name, group, keystrokes) for group in groups])
+    finally:
+        pool.close()
+        pool.join()
+
+
+class _Poller(object):
+    """Waits for any of a set of file descriptors to become readable, using
+    :mod:`selectors` where available, then :func:`select.poll`, and only then
+    :func:`select.select` (which can't watch descriptors numbered 1024 or
+    above)."""
+
+    def __init__(self):
+        self._selector = self._poll = None
+        self._fds = set()
+        if selectors is not None:
+            self._selector = selectors.DefaultSelector()
+        elif hasattr(select, 'poll'):
+            self._poll = select.poll()
+
+    def register(self, fd):
+        if self._selector is not None:
+            self._selector.register(fd, selectors.EVENT_READ)
+        elif self._poll is not None:
+            self._poll.register(fd, select.POLLIN)
+        self._fds.add(fd)
+
+    def unregister(self, fd):
+        if self._selector is not None:
+            self._selector.unregister(fd)
+        elif self._poll is not None:
+            self._poll.unregister(fd)
+        self._fds.discard(fd)
+
+    def wait(self):
+        """Block until at least one descriptor is readable, and return the
+        readable ones."""
+        if self._selector is not None:
+            return [key.fd for key, _ in self._selector.select()]
+        if self._poll is not None:
+            return [fd for fd, _ in self._poll.poll()]
+        return select.select(list(self._fds), [], [])[0]
+
+    def close(self):
+        if self._selector is not None:
+            self._selector.close()
+
+
+def _run_select(socket_name, sessions, keystrokes, concurrency):
+    """Drive every session from a single thread, keeping up to
+    ``concurrency`` tmux clients running at once. Each client's output pipe
+    is closed when it exits, so waiting on the pipes finds the finished
+    clients without reaping any other child process."""
+    poller = _Poller()
+    try:
+        return _drive_select(poller, socket_name, sessions, keystrokes,
+                             concurrency)
+    finally:
+        poller.close()
+
+
+def _drive_select(poller, socket_name, sessions, keystrokes, concurrency):
+    pending = dict((session, 0) for session in sessions)
+    ready = deque(sessions)
+    in_flight = {}
+    results = dict((session, ([], 0)) for session in sessions)
+
+    while ready or in_flight:
+        while ready and len(in_flight) < concurrency:
+            session = ready.popleft()
+            key = chr(ord('a') + pending[session] % 26)
+            args = oraide._tmux_command(socket_name, 'send-keys', '-l',
+                                        '-t{}'.format(session), key)
+            start = _clock()
+            proc = subprocess.Popen(args, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT)
+            fd = proc.stdout.fileno()
+            in_flight[fd] = (proc, session, start)
+            poller.register(fd)
+
+        for fd in poller.wait():
+            if os.read(fd, 4096):
+                continue  # an error message; the pipe closes on exit
+            proc, session, start = in_flight.pop(fd)
+            poller.unregister(fd)
+            proc.stdout.close()
+            proc.wait()
+            latency = _clock() - start
+
+            latencies, failures = results[session]
+            if proc.returncode:
+                results[session] = (latencies, failures + 1)
+            else:
+                latencies.append(latency)
+
+            pending[session] += 1
+            if pending[session] < keystrokes:
+                ready.append(session)
+
+    return [results[session] for session in sessions]
+
+
+def run_level(sessions, mode='threads', concurrency=None, keystrokes=50,
+              server=None):
+    """Measure one point of the scaling curve and return it as a dictionary
+    with the keys in ``FIELDS``.
+
+    :param int sessions: the number of concurrent sessions
+    :param mode: one of ``'threads'``, ``'processes'``, or ``'select'``
+    :param int concurrency: the number of workers (or, in ``select`` mode, the
+        number of tmux commands in flight); defaults to one per session
+    :param int keystrokes: the number of keystrokes to send to each session
+    :param server: a started :class:`oraide.server.PrivateServer` to use
+        instead of starting a new one
+    """
+    if mode not in MODES:
+        raise ValueError('mode must be one of {}'.format(', '.join(MODES)))
+    concurrency = min(concurrency or sessions, sessions)
+
+    owns_server = server is None
+    if owns_server:
+        server = PrivateServer(sessions)
+        server.start()
+    try:
+        names = server.sessions[:sessions]
+        cpu_before = server.cpu_seconds()
+        start = _clock()
+
+        if mode == 'select':
+            results = _run_select(server.socket_name, names, keystrokes,
+                                  concurrency)
+        else:
+            groups = [names[i::concurrency] for i in range(concurrency)]
+            runner = _run_threads if mode == 'threads' else _run_processes
+            results = runner(server.socket_name, groups, keystrokes)
+
+        seconds = _clock() - start
+        cpu_after = server.cpu_seconds()
+    finally:
+        if owns_server:
+            server.kill()
+
+    latencies = [latency for group, _ in results for latency in group]
+    failures = sum(failed for _, failed in results)
+    sends = len(latencies) + failures
+
+    def ms(value):
+        return None if value is None else value * 1000
+
+    return {
+        'sessions': sessions,
+        'mode': mode,
+        'concurrency': concurrency,
+        'sends': sends,
+        'failures': failures,
+        'failure_rate': failures / sends if sends else 0.0,
+        'seconds': seconds,
+        'throughput': len(latencies) / seconds if seconds else 0.0,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p90_ms': ms(percentile(latencies, 0.90)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(max(latencies) if latencies else None),
+        'server_cpu': (None if None in (cpu_before, cpu_after)
+                       else (cpu_after - cpu_before) / seconds),
+    }
+
+
+def run_curve(levels, mode='threads', concurrency=None, keystrokes=50,
+              stream=None, csv_path=None):
+    """Measure each number of sessions in ``levels``, printing a line for
+    each, and return the list of results.
+
+    :param csv_path: the path of a CSV file in which to save the results
+    """
+    stream = stream if stream is not None else sys.stdout
+    header = (u'{:>8} {:>10} {:>8} {:>7} {:>12} {:>9} {:>9} {:>9} {:>9} '
+              u'{:>10}')
+    print(header.format(u'sessions', u'sends/s', u'failed', u'fail%',
+                        u'p50 ms', u'p90 ms', u'p99 ms', u'max ms',
+                        u'cpu%', u'seconds'), file=stream)
+
+    results = []
+    for sessions in levels:
+        result = run_level(sessions, mode=mode, concurrency=concurrency,
+                           keystrokes=keystrokes)
+        results.append(result)
+        print(header.format(
+            result['sessions'], _fmt(result['throughput']),
+            result['failures'], _fmt(result['failure_rate'] * 100),
+            _fmt(result['p50_ms']), _fmt(result['p90_ms']),
+            _fmt(result['p99_ms']), _fmt(result['max_ms']),
+            _fmt(None if result['server_cpu'] is None
+                 else result['server_cpu'] * 100),
+            _fmt(result['seconds'], 2)), file=stream)
+
+    if csv_path:
+        with open(csv_path, 'w') as fp:
+            writer = csv.DictWriter(fp, FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+
+    return results
+
+
+def _fmt(value, places=1):
+    return u'-' if value is None else u'{:.{}f}'.format(value, places)
+
+
+__all__ = ['run_curve', 'run_level']
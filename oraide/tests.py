@@ -1,12 +1,35 @@
+import gc
+import io
+import json
 import locale
 import logging
 import os
+import shutil
+import socket
+import tempfile
 import subprocess
+import sys
+import threading
 import time
 import unittest
-
-from oraide import (ConnectionFailedError, prompt, send_keys, Session,
-                    SessionNotFoundError)
+import weakref
+
+from oraide import (_iter_bursts, _iter_graphemes, _iter_lines, _iter_text,
+                    Cancelled, capture_pane,
+                    CircuitOpenError, ConnectionFailedError, prompt,
+                    send_keys, server_health, Session, SessionNotFoundError)
+import oraide
+from oraide import control, journal, keys
+from oraide.cluster import Cluster, ClusterError
+from oraide.daemon import Daemon, submit
+from oraide.output import PipeInUseError
+from oraide.profiling import Profiler
+from oraide.remote import (_coalesce, Agent, Node, RemoteError,
+                           RemoteSession)
+from oraide.script import Script
+from oraide.server import PrivateServer
+from oraide.stress import percentile, run_level
+from oraide.timeline import Timeline
 
 SHELL_PROMPT = os.environ.get('ORAIDE_TEST_PROMPT', u'$')
 SHELL_PROMPT = (SHELL_PROMPT.decode(locale.getdefaultlocale()[1])
@@ -35,6 +58,7 @@ def assert_after_timeout(fn, timeout_duration=2.0):
 class LiveSessionMixin(object):
     def start_tmux_session(self, timeout_duration=2.0):
         self.kill_tmux_session()
+        server_health().reset()
 
         logging.info('Starting tmux session: {}'.format(self.session_name))
 
@@ -102,6 +126,30 @@ class TestSendKeys(LiveSessionMixin, unittest.TestCase):
         with self.assertRaises(SessionNotFoundError):
             send_keys(self.session_name + '__', self.verification_string)
 
+    def test_send_literal_char(self):
+        self.start_tmux_session()
+        session = Session(self.session_name)
+
+        for key in self.verification_string:
+            session.send_literal_char(key)
+
+        @assert_after_timeout
+        def _assertion():
+            self.assertIn(self.verification_string,
+                          self.get_tmux_session_contents())
+        _assertion()
+
+    def test_send_literal_char_follows_session_name(self):
+        self.start_tmux_session()
+        session = Session(self.session_name + '__')
+        session.session = self.session_name
+
+        session.send_literal_char('x')
+
+        session.socket_name = '__missing'
+        with self.assertRaises(ConnectionFailedError):
+            session.send_literal_char('x')
+
     def test_no_server_raises_connection_failed_error(self):
         with self.assertRaises(ConnectionFailedError):
             send_keys(self.session_name, self.verification_string)
@@ -110,6 +158,162 @@ class TestSendKeys(LiveSessionMixin, unittest.TestCase):
         self.kill_tmux_session()
 
 
+class TestScreen(LiveSessionMixin, unittest.TestCase):
+    session_name = TESTING_SESSION_NAME
+    verification_string = 'q8vk2m0d'
+
+    def setUp(self):
+        self.start_tmux_session()
+        self.session = Session(self.session_name, enable_auto_advance=True)
+
+    def test_capture_pane_matches_session_contents(self):
+        encoding = locale.getdefaultlocale()[1]
+        self.assertEqual(self.get_tmux_session_contents(),
+                         capture_pane(self.session_name).decode(encoding))
+
+    def test_first_call_returns_every_line(self):
+        rows = self.session.screen()
+
+        self.assertEqual(list(range(len(rows))), [row for row, _ in rows])
+        self.assertIn(SHELL_PROMPT, ''.join(line for _, line in rows))
+
+    def test_unchanged_screen_returns_nothing(self):
+        self.session.screen()
+
+        self.assertEqual([], self.session.screen())
+
+    def test_only_changed_lines_are_returned(self):
+        before = self.session.screen(full=True)
+        self.session.send_keys(self.verification_string)
+
+        @assert_after_timeout
+        def _assertion():
+            changed = self.session.screen()
+            self.assertEqual(1, len(changed))
+            self.assertIn(self.verification_string, changed[0][1])
+        _assertion()
+
+        after = self.session.screen(full=True)
+        self.assertEqual(len(before), len(after))
+
+    def test_missing_session_raises_session_not_found_error(self):
+        with self.assertRaises(SessionNotFoundError):
+            Session(self.session_name + '__').screen()
+
+    def tearDown(self):
+        self.kill_tmux_session()
+
+
+class TestOutput(LiveSessionMixin, unittest.TestCase):
+    session_name = TESTING_SESSION_NAME
+
+    def setUp(self):
+        self.start_tmux_session()
+        self.session = Session(self.session_name, enable_auto_advance=True)
+
+    def read_until(self, lines, text, timeout=2.0):
+        deadline = time.time() + timeout
+        seen = []
+        while time.time() < deadline:
+            line = lines.get(timeout=0.1)
+            if line is not None:
+                seen.append(line)
+                if line == text:
+                    return seen
+        self.fail('{!r} not printed; saw {!r}'.format(text, seen))
+
+    def test_lines_are_streamed(self):
+        with self.session.output() as lines:
+            self.session.enter('printf "one\\ntwo\\n"', teletype=False)
+
+            seen = self.read_until(lines, 'two')
+
+        self.assertIn('one', seen)
+        self.assertTrue(lines.closed)
+        self.assertEqual(None, lines.get(timeout=0.01))
+
+    def test_carriage_returns_redraw_the_line(self):
+        with self.session.output() as lines:
+            self.session.enter('printf "1%%\\r"; sleep 0.2; '
+                               'printf "50%%\\r"; sleep 0.2; echo done',
+                               teletype=False)
+
+            self.read_until(lines, 'done')
+
+    def test_second_stream_is_refused(self):
+        with self.session.output() as lines:
+            with self.assertRaises(PipeInUseError):
+                self.session.output()
+
+            self.session.enter('echo still', teletype=False)
+            self.read_until(lines, 'still')
+
+    def test_close_after_pane_is_gone(self):
+        lines = self.session.output()
+        subprocess.call(['tmux', 'kill-session',
+                         '-t{}'.format(self.session_name)])
+
+        def fail(args, *rest, **kwargs):
+            raise subprocess.CalledProcessError(1, args, b"can't find pane")
+        original_tmux = oraide._tmux
+        oraide._tmux = fail
+        try:
+            lines.close()
+        finally:
+            oraide._tmux = original_tmux
+
+        self.assertTrue(lines.closed)
+
+    def test_iteration_ends_when_closed(self):
+        lines = self.session.output()
+        self.session.enter('echo done', teletype=False)
+        self.read_until(lines, 'done')
+        lines.close()
+
+        self.assertEqual([], list(lines))
+
+    def test_drop_oldest_keeps_recent_lines(self):
+        with self.session.output(buffer_size=3, history=5) as lines:
+            self.session.enter('seq 1 20; echo end', teletype=False)
+
+            @assert_after_timeout
+            def _assertion():
+                self.assertEqual(['end'], lines.recent()[-1:])
+            _assertion()
+
+            pending = [lines.get(timeout=0.1) for _ in range(3)]
+
+        self.assertEqual(['19', '20', 'end'], pending)
+        self.assertEqual(['17', '18', '19', '20', 'end'], lines.recent())
+        self.assertTrue(lines.dropped > 0)
+
+    def test_drop_newest_keeps_first_lines(self):
+        with self.session.output(buffer_size=2,
+                                 overflow='drop-newest') as lines:
+            self.session.enter('echo first; echo second; echo third',
+                               teletype=False)
+
+            @assert_after_timeout
+            def _assertion():
+                self.assertEqual(['third'], lines.recent()[-1:])
+            _assertion()
+
+            first = lines.get(timeout=0.1)
+
+        self.assertIn('echo first', first)
+
+    def test_invalid_overflow_policy(self):
+        with self.assertRaises(ValueError):
+            self.session.output(overflow='explode')
+
+    def test_missing_session(self):
+        with self.assertRaises(SessionNotFoundError):
+            Session(self.session_name + '__').output()
+
+    def tearDown(self):
+        self.kill_tmux_session()
+
+
 class TestSession(unittest.TestCase):
     session_name = TESTING_SESSION_NAME
 
@@ -127,6 +331,251 @@ class TestSession(unittest.TestCase):
             self.assertTrue(s1.auto_advancing)
         self.assertFalse(s2.auto_advancing)
 
+    def test_auto_advance_restores_state_after_exception(self):
+        s = Session(self.session_name)
+
+        with self.assertRaises(ValueError):
+            with s.auto_advance():
+                raise ValueError()
+
+        self.assertFalse(s.auto_advancing)
+
+    def test_auto_advance_is_local_to_thread(self):
+        s = Session(self.session_name)
+        entered = threading.Event()
+        release = threading.Event()
+        seen = []
+
+        def advance_in_thread():
+            with s.auto_advance():
+                seen.append(s.auto_advancing)
+                entered.set()
+                release.wait(2.0)
+
+        thread = threading.Thread(target=advance_in_thread)
+        thread.start()
+        entered.wait(2.0)
+        seen.append(s.auto_advancing)
+        release.set()
+        thread.join()
+
+        self.assertEqual([True, False], seen)
+
+    def test_auto_advancing_can_be_set(self):
+        s = Session(self.session_name)
+
+        s.auto_advancing = True
+
+        self.assertTrue(s.auto_advancing)
+        self.assertFalse(Session(self.session_name).auto_advancing)
+
+    def test_auto_advance_restores_default(self):
+        s = Session(self.session_name)
+
+        with s.auto_advance():
+            with s.auto_advance():
+                self.assertTrue(s.auto_advancing)
+            self.assertTrue(s.auto_advancing)
+        s.enable_auto_advance = True
+
+        self.assertTrue(s.auto_advancing)
+
+    def test_auto_advancing_does_not_keep_session_alive(self):
+        s = Session(self.session_name)
+        s.auto_advancing = True
+        ref = weakref.ref(s)
+
+        del s
+        gc.collect()
+
+        self.assertIsNone(ref())
+
+    def test_sends_from_many_threads_are_serialized(self):
+        active = []
+        overlaps = []
+
+        s = Session(self.session_name)
+
+        def fake_send_keys(*args, **kwargs):
+            active.append(1)
+            if len(active) > 1:
+                overlaps.append(len(active))
+            time.sleep(0.001)
+            active.pop()
+
+        original_send_keys = oraide.send_keys
+        oraide.send_keys = fake_send_keys
+        try:
+            threads = [threading.Thread(target=lambda: [s.send_keys('x')
+                                                        for _ in range(10)])
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            oraide.send_keys = original_send_keys
+
+        self.assertEqual([], overlaps)
+
+
+class RecordingSession(Session):
+    """A session that records keystrokes instead of sending them to tmux."""
+    def __init__(self, *args, **kwargs):
+        super(RecordingSession, self).__init__(*args, **kwargs)
+        self.sent = []
+
+    def send_keys(self, keys, literal=True):
+        self.sent.append((keys, literal))
+
+    def send_literal_char(self, key):
+        self.sent.append((key, True))
+
+
+class TestPauseAndCancel(unittest.TestCase):
+    def start(self, target):
+        thread = threading.Thread(target=target)
+        thread.start()
+        self.addCleanup(thread.join)
+        return thread
+
+    def wait_for_keys(self, session, count):
+        deadline = time.time() + 2
+        while len(session.sent) < count and time.time() < deadline:
+            time.sleep(0.005)
+
+    def test_pause_and_resume(self):
+        s = RecordingSession('test', enable_auto_advance=True)
+        self.start(lambda: s.teletype('abcd', delay=20))
+        self.wait_for_keys(s, 1)
+
+        s.pause()
+        self.assertTrue(s.paused)
+        time.sleep(0.1)
+        sent_while_paused = len(s.sent)
+        time.sleep(0.1)
+        self.assertEqual(sent_while_paused, len(s.sent))
+        self.assertTrue(sent_while_paused < 4)
+
+        s.resume()
+        self.wait_for_keys(s, 4)
+        self.assertEqual(['a', 'b', 'c', 'd'], [k for k, _ in s.sent])
+
+    def test_cancel_while_paused(self):
+        s = RecordingSession('test')
+        errors = []
+        auto_advancing = []
+        original_input = oraide._input
+        oraide._input = lambda msg: None
+        self.addCleanup(setattr, oraide, '_input', original_input)
+
+        def type_and_enter():
+            try:
+                s.enter('abcd')
+            except Cancelled as exc:
+                errors.append(exc)
+            auto_advancing.append(s.auto_advancing)
+        thread = self.start(type_and_enter)
+        self.wait_for_keys(s, 1)
+
+        s.pause()
+        s.cancel()
+        thread.join(1.0)
+
+        self.assertEqual(1, len(errors))
+        self.assertNotIn(('Enter', False), s.sent)
+        self.assertFalse(s.paused)
+        self.assertEqual([False], auto_advancing)
+
+        del s.sent[:]
+        s.enter('e', teletype=False)
+        self.assertEqual([('e', True), ('Enter', False)], s.sent)
+
+    def test_cancel_between_steps_does_nothing(self):
+        s = RecordingSession('test', enable_auto_advance=True)
+
+        s.cancel()
+        s.teletype('ab', delay=0)
+
+        self.assertEqual(2, len(s.sent))
+
+
+class TestCheckpoint(unittest.TestCase):
+    def test_checkpoints_are_numbered_in_order(self):
+        s = Session('test')
+
+        self.assertEqual(1, s.checkpoint())
+        self.assertEqual(2, s.checkpoint('second'))
+        self.assertEqual(2, s.last_checkpoint)
+
+    def test_fast_forward_until_resume_checkpoint(self):
+        s = Session('test', resume_from=2)
+
+        self.assertTrue(s.fast_forwarding)
+        s.checkpoint()
+        self.assertTrue(s.fast_forwarding)
+        s.checkpoint()
+        self.assertFalse(s.fast_forwarding)
+
+    def test_no_fast_forward_by_default(self):
+        self.assertFalse(Session('test').fast_forwarding)
+
+    def test_resume_from_environment(self):
+        os.environ['ORAIDE_RESUME_FROM'] = '3'
+        try:
+            s = Session('test')
+        finally:
+            del os.environ['ORAIDE_RESUME_FROM']
+            oraide._run_checkpoints = None
+
+        self.assertEqual(3, s.resume_from)
+
+    def test_environment_checkpoints_are_shared(self):
+        os.environ['ORAIDE_RESUME_FROM'] = '1'
+        try:
+            first, second = Session('first'), Session('second')
+        finally:
+            del os.environ['ORAIDE_RESUME_FROM']
+            oraide._run_checkpoints = None
+
+        self.assertTrue(second.fast_forwarding)
+        first.checkpoint()
+        self.assertFalse(second.fast_forwarding)
+        self.assertEqual(1, second.last_checkpoint)
+
+    def test_shared_checkpoints(self):
+        checkpoints = oraide.Checkpoints(resume_from=2)
+        first = Session('first', checkpoints=checkpoints)
+        second = Session('second', checkpoints=checkpoints)
+
+        self.assertEqual(1, first.checkpoint())
+        self.assertEqual(2, second.checkpoint())
+        self.assertFalse(first.fast_forwarding)
+        self.assertFalse(Session('other').fast_forwarding)
+
+    def test_shared_checkpoints_with_resume_from(self):
+        with self.assertRaises(ValueError):
+            Session('test', resume_from=1, checkpoints=oraide.Checkpoints())
+
+    def test_fast_forward_sends_keys_at_once_without_prompt(self):
+        s = RecordingSession('test', resume_from=1)
+
+        start = time.time()
+        s.enter('a long line of text', teletype=True)
+
+        self.assertTrue(time.time() - start < 0.5)
+        self.assertEqual([('a long line of text', True), ('Enter', False)],
+                         s.sent)
+
+    def test_normal_pace_after_resume_checkpoint(self):
+        s = RecordingSession('test', enable_auto_advance=True,
+                             resume_from=1)
+        s.checkpoint()
+
+        s.teletype('abc', delay=10)
+
+        self.assertEqual([('a', True), ('b', True), ('c', True)], s.sent)
+
 
 class TestPrompt(unittest.TestCase):
     def fake_input(*args, **kwargs):
@@ -147,6 +596,115 @@ class TestPrompt(unittest.TestCase):
         fn(Session('test'))
 
 
+class TestIterText(unittest.TestCase):
+    def test_string_source(self):
+        self.assertEqual([u'abc'], list(_iter_text(u'abc')))
+
+    def test_iterable_source(self):
+        chunks = (c for c in [u'ab', u'', u'cd'])
+        self.assertEqual([u'ab', u'cd'], list(_iter_text(chunks)))
+
+    def test_multibyte_character_split_across_chunks(self):
+        encoded = u'caf\xe9 \u2603'.encode('utf-8')
+        chunks = [encoded[i:i + 1] for i in range(len(encoded))]
+
+        self.assertEqual(u'caf\xe9 \u2603', u''.join(_iter_text(chunks)))
+
+    def test_binary_file_source(self):
+        fp = io.BytesIO(u'\u2603\u2603\u2603'.encode('utf-8'))
+
+        chunks = list(_iter_text(fp, chunk_size=2))
+
+        self.assertEqual(u'\u2603\u2603\u2603', u''.join(chunks))
+        self.assertTrue(len(chunks) > 1)
+
+    def test_text_file_source(self):
+        fp = io.StringIO(u'line one\nline two\n')
+
+        self.assertEqual(u'line one\nline two\n',
+                         u''.join(_iter_text(fp, chunk_size=3)))
+
+
+class TestIterLines(unittest.TestCase):
+    def test_lines_split_across_chunks(self):
+        chunks = [u'fir', u'st\nsec', u'ond\r\n', u'third']
+
+        self.assertEqual([u'first', u'second', u'third'],
+                         list(_iter_lines(chunks)))
+
+    def test_blank_lines_are_kept(self):
+        self.assertEqual([u'a', u'', u'b'], list(_iter_lines(u'a\n\nb\n')))
+
+
+class TestBursts(unittest.TestCase):
+    def test_combining_marks_stay_with_base_character(self):
+        text = u'cafe\u0301s'
+
+        self.assertEqual([u'c', u'a', u'f', u'e\u0301', u's'],
+                         list(_iter_graphemes(text)))
+
+    def test_emoji_sequences_stay_together(self):
+        family = u'\U0001f468\u200d\U0001f469\u200d\U0001f467'
+        thumbs_up = u'\U0001f44d\U0001f3fd'
+        flags = u'\U0001f1eb\U0001f1f7\U0001f1e9\U0001f1ea'
+
+        self.assertEqual([family, thumbs_up, flags[:2], flags[2:]],
+                         list(_iter_graphemes(family + thumbs_up + flags)))
+
+    def test_bursts_end_at_word_boundaries(self):
+        bursts = list(_iter_bursts(u'ls -la /tmp', 4))
+
+        self.assertEqual([(u'ls ', 3), (u'-la ', 4), (u'/tmp', 4)], bursts)
+
+    def test_bursts_never_split_clusters(self):
+        text = u'e\u0301' * 5
+
+        bursts = [burst for burst, _ in _iter_bursts(text, 2)]
+
+        self.assertEqual(text, u''.join(bursts))
+        self.assertEqual([u'e\u0301e\u0301', u'e\u0301e\u0301',
+                          u'e\u0301'], bursts)
+
+    def test_teletype_sends_bursts(self):
+        s = RecordingSession('test', enable_auto_advance=True)
+
+        s.teletype(u'echo hello', delay=10, burst=3)
+
+        self.assertEqual([u'ech', u'o ', u'hel', u'lo'],
+                         [keys for keys, _ in s.sent])
+
+    def test_stream_bursts_never_split_clusters(self):
+        s = RecordingSession('test', enable_auto_advance=True)
+        flag = u'\U0001f1eb\U0001f1f7'
+        chunks = [u'cafe', u'\u0301 ', flag[:1], flag[1:]]
+
+        s.teletype_stream(iter(chunks), delay=10, burst=2)
+
+        self.assertEqual([u'ca', u'f', u'e\u0301', u' ', flag],
+                         [keys for keys, _ in s.sent])
+
+    def test_session_burst_default(self):
+        s = RecordingSession('test', enable_auto_advance=True,
+                             teletype_burst=4)
+
+        s.teletype(u'abcdef', delay=10)
+
+        self.assertEqual([u'abcd', u'ef'], [keys for keys, _ in s.sent])
+
+    def test_burst_keeps_typing_speed(self):
+        s = RecordingSession('test', enable_auto_advance=True)
+        slept = []
+        original_sleep = oraide._sleep
+        oraide._sleep = lambda seconds, flow=None: slept.append(seconds)
+        try:
+            s.teletype(u'abcdefgh', delay=100, burst=4)
+        finally:
+            oraide._sleep = original_sleep
+
+        self.assertEqual(2, len(slept))
+        self.assertTrue(0.72 <= sum(slept) <= 0.88)
+
+
 class TestTeletypeDelay(LiveSessionMixin, unittest.TestCase):
     session_name = TESTING_SESSION_NAME
 
@@ -228,6 +786,27 @@ class TestSessionEnter(LiveSessionMixin, unittest.TestCase):
             self.get_tmux_session_contents()
         )
 
+    def test_enter_stream(self):
+        source = io.StringIO(u"echo 'test_enter_stream'\necho 'done'\n")
+
+        self.session.enter_stream(source, teletype=False)
+
+        @assert_after_timeout
+        def _assertion():
+            output = self.get_tmux_session_contents()
+            self.assertEqual(output.count('test_enter_stream'), 2)
+            self.assertEqual(output.count('done'), 2)
+        _assertion()
+
+    def test_teletype_stream_from_bytes(self):
+        chunks = [b"echo 'test_teletype_", b"stream'"]
+
+        self.session.teletype_stream(iter(chunks), delay=10)
+
+        self.assertIn('test_teletype_stream',
+                      self.get_tmux_session_contents())
+        self.session.enter()
+
     def test_keys_without_teletype_with_enter(self):
         self.session.enter("echo 'test_keys_without_teletype_with_enter'")
 
@@ -238,3 +817,901 @@ class TestSessionEnter(LiveSessionMixin, unittest.TestCase):
 
     def tearDown(self):
         self.kill_tmux_session()
+
+
+class TestTimeline(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def record(self, label):
+        with self.lock:
+            self.calls.append(label)
+
+    def test_simultaneous_steps_dispatch_in_order_added(self):
+        timeline = Timeline()
+        for label in 'abcde':
+            timeline.add(self.record, args=[label], session='same')
+
+        timeline.run()
+
+        self.assertEqual(list('abcde'), self.calls)
+
+    def test_steps_start_in_order_of_start_time(self):
+        timeline = Timeline()
+        timeline.add(self.record, args=['late'], start=0.1, session='s')
+        timeline.add(self.record, args=['early'], start=0.0, session='s')
+
+        timeline.run()
+
+        self.assertEqual(['early', 'late'], self.calls)
+
+    def test_required_steps_finish_first(self):
+        def slow(label):
+            time.sleep(0.1)
+            self.record(label)
+
+        timeline = Timeline()
+        first = timeline.add(slow, args=['server'], session='server')
+        second = timeline.add(self.record, args=['client'], start=0.05,
+                              requires=[first], session='client')
+
+        timeline.run()
+
+        self.assertEqual(['server', 'client'], self.calls)
+        self.assertTrue(second.started >= first.finished + 0.05)
+
+    def test_sessions_run_concurrently(self):
+        started = threading.Event()
+
+        def wait_for_other():
+            self.assertTrue(started.wait(2.0))
+            self.record('waited')
+
+        timeline = Timeline()
+        timeline.add(wait_for_other, session='one')
+        timeline.add(started.set, session='two')
+
+        timeline.run()
+
+        self.assertEqual(['waited'], self.calls)
+
+    def test_failure_stops_later_steps(self):
+        def fail():
+            raise ValueError('step failed')
+
+        timeline = Timeline()
+        failing = timeline.add(fail, session='s')
+        timeline.add(self.record, args=['after'], requires=[failing])
+
+        with self.assertRaises(ValueError):
+            timeline.run()
+        self.assertEqual([], self.calls)
+
+    def test_system_exit_is_reported(self):
+        timeline = Timeline()
+        timeline.add(sys.exit, args=[3], session='s')
+
+        with self.assertRaises(SystemExit):
+            timeline.run()
+
+    def test_foreign_requirement_is_rejected(self):
+        other = Timeline().add(self.record, args=['x'])
+
+        with self.assertRaises(ValueError):
+            Timeline().add(self.record, args=['y'], requires=[other])
+
+    def test_session_methods_are_auto_advanced(self):
+        record = self.record
+
+        class RecordingSession(Session):
+            def note(self):
+                record(self.auto_advancing)
+
+        session = RecordingSession('oraide_timeline_test')
+        timeline = Timeline()
+        step = timeline.add(session.note)
+
+        timeline.run()
+
+        self.assertEqual('oraide_timeline_test', step.session)
+        self.assertEqual([True], self.calls)
+        self.assertFalse(session.auto_advancing)
+
+
+class TestProfiler(unittest.TestCase):
+    def test_steps_are_recorded_with_sleep_time(self):
+        s = RecordingSession('test', enable_auto_advance=True)
+
+        with Profiler() as profiler:
+            s.teletype('ab', delay=10)
+            s.enter('c', teletype=False)
+
+        self.assertEqual([1, 2], [step.number for step in profiler.steps])
+        teletype_step = profiler.steps[0]
+        self.assertTrue(teletype_step.categories['sleep'] > 0)
+        self.assertTrue(teletype_step.total >=
+                        teletype_step.categories['sleep'])
+
+    def test_presenter_wait_is_recorded(self):
+        original_input = oraide._input
+        oraide._input = lambda msg: time.sleep(0.01)
+        try:
+            with Profiler() as profiler:
+                RecordingSession('test').enter(teletype=False)
+        finally:
+            oraide._input = original_input
+
+        self.assertEqual(1, len(profiler.steps))
+        self.assertTrue(profiler.steps[0].categories['presenter wait'] > 0)
+
+    def test_control_mode_reply_is_recorded(self):
+        class SlowClient(object):
+            def execute(self, args):
+                time.sleep(0.01)
+                return 0, b''
+
+        oraide._control_clients['oraide-test-profile'] = SlowClient()
+        try:
+            with Profiler() as profiler:
+                Session('test', socket_name='oraide-test-profile').send_keys(
+                    'a')
+        finally:
+            del oraide._control_clients['oraide-test-profile']
+
+        self.assertTrue(profiler.steps[0].categories['tmux reply'] >= 0.01)
+        self.assertEqual(0, profiler.steps[0].categories['fork/exec'])
+
+    def test_uninstall_restores_originals(self):
+        original_sleep = oraide._sleep
+        original_teletype = Session.__dict__['teletype']
+
+        with Profiler():
+            self.assertNotEqual(original_sleep, oraide._sleep)
+
+        self.assertEqual(original_sleep, oraide._sleep)
+        self.assertEqual(original_teletype, Session.__dict__['teletype'])
+
+    def test_folded_output(self):
+        s = RecordingSession('test', enable_auto_advance=True)
+
+        with Profiler() as profiler:
+            s.teletype('a;b', delay=10)
+
+        lines = profiler.folded(root='demo.py')
+        self.assertTrue(lines)
+        for line in lines:
+            frames, count = line.rsplit(' ', 1)
+            self.assertEqual(3, len(frames.split(';')))
+            self.assertTrue(frames.startswith("demo.py;1 [test] teletype"))
+            self.assertTrue(int(count) > 0)
+
+    def test_report(self):
+        s = RecordingSession('test', enable_auto_advance=True)
+        with Profiler() as profiler:
+            s.enter('a', teletype=False)
+        stream = io.StringIO()
+
+        profiler.report(stream)
+
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(3, len(lines))
+        self.assertIn('presenter wait', lines[0])
+        self.assertIn("[test] enter 'a'", lines[1])
+
+
+class TestStress(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(50, percentile(values, 0.5))
+        self.assertEqual(99, percentile(values, 0.99))
+        self.assertEqual(1, percentile(values, 0))
+        self.assertEqual(None, percentile([], 0.5))
+
+    def test_session_on_private_server(self):
+        with PrivateServer(1) as server:
+            session = Session(server.sessions[0],
+                              socket_name=server.socket_name)
+            session.send_keys('abc')
+
+            with self.assertRaises(ConnectionFailedError):
+                send_keys(server.sessions[0], 'abc', socket_name='__missing')
+
+    def test_each_mode(self):
+        with PrivateServer(2) as server:
+            for mode in ('threads', 'processes', 'select'):
+                result = run_level(2, mode=mode, keystrokes=3, server=server)
+
+                self.assertEqual(6, result['sends'])
+                self.assertEqual(0, result['failures'])
+                self.assertTrue(result['p50_ms'] <= result['max_ms'])
+
+    def test_select_mode_leaves_other_children(self):
+        child = subprocess.Popen(['sh', '-c', 'exit 3'])
+        with PrivateServer(1) as server:
+            run_level(1, mode='select', keystrokes=3, server=server)
+
+        self.assertEqual(3, child.wait())
+
+    def test_select_mode_with_high_descriptors(self):
+        import resource
+        if resource.getrlimit(resource.RLIMIT_NOFILE)[0] < 1200:
+            self.skipTest('too few file descriptors allowed')
+        # push the pipes of the tmux clients past FD_SETSIZE
+        filler = [os.open(os.devnull, os.O_RDONLY) for _ in range(1100)]
+        try:
+            with PrivateServer(2) as server:
+                result = run_level(2, mode='select', keystrokes=2,
+                                   server=server)
+        finally:
+            for fd in filler:
+                os.close(fd)
+
+        self.assertEqual(0, result['failures'])
+
+    def test_failures_are_counted(self):
+        server = PrivateServer(2)
+        server.sessions = ['missing1', 'missing2']
+
+        result = run_level(2, mode='select', keystrokes=2, server=server)
+
+        self.assertEqual(4, result['failures'])
+        self.assertEqual(1.0, result['failure_rate'])
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    socket_name = 'oraide-test-circuit'
+
+    def setUp(self):
+        self.health = server_health(self.socket_name)
+        self.health.reset()
+        self.spawned = []
+        self.original_spawn = oraide._spawn
+
+        def counting_spawn(args):
+            self.spawned.append(args)
+            return self.original_spawn(args)
+        oraide._spawn = counting_spawn
+
+    def test_trips_after_first_failure_and_fails_fast(self):
+        with self.assertRaises(ConnectionFailedError):
+            send_keys('s', 'x', socket_name=self.socket_name)
+        self.assertTrue(self.health.tripped)
+
+        with self.assertRaises(CircuitOpenError):
+            send_keys('s', 'x', socket_name=self.socket_name)
+        self.assertEqual(1, len(self.spawned))
+
+    def test_message_without_health(self):
+        self.assertEqual('tmux server unreachable; not retrying yet.',
+                         str(CircuitOpenError(1, 'send-keys', b'')))
+
+    def test_probe_after_backoff(self):
+        self.health.initial_backoff = 0.01
+        self.health.reset()
+        with self.assertRaises(ConnectionFailedError):
+            send_keys('s', 'x', socket_name=self.socket_name)
+
+        time.sleep(0.02)
+        with self.assertRaises(ConnectionFailedError) as context:
+            send_keys('s', 'x', socket_name=self.socket_name)
+
+        self.assertNotIsInstance(context.exception, CircuitOpenError)
+        self.assertEqual(2, len(self.spawned))
+        self.assertEqual(0.04, self.health.backoff)
+
+    def test_backoff_is_capped(self):
+        self.health.max_backoff = 1.0
+        for _ in range(10):
+            self.health.record_failure()
+
+        self.assertEqual(1.0, self.health.backoff)
+        self.assertFalse(self.health.allow_probe())
+
+    def test_success_resets_circuit(self):
+        self.health.record_failure()
+
+        self.health.record_success()
+
+        self.assertFalse(self.health.tripped)
+        self.assertEqual(0, self.health.failures)
+
+    def test_restart_command_starts_session_again(self):
+        session = Session('restarted', socket_name=self.socket_name,
+                          restart_command='cat > /dev/null')
+        try:
+            session.send_keys('x')
+            session.send_literal_char('y')
+        finally:
+            subprocess.call(['tmux', '-L', self.socket_name, 'kill-server'])
+
+        self.assertFalse(self.health.tripped)
+
+    def tearDown(self):
+        oraide._spawn = self.original_spawn
+        self.health.reset()
+
+
+class TestControl(unittest.TestCase):
+    def setUp(self):
+        self.server = PrivateServer(1)
+        self.server.start()
+        self.session = Session(self.server.sessions[0],
+                               socket_name=self.server.socket_name)
+        self.spawned = []
+        self.original_spawn = oraide._spawn
+
+        def counting_spawn(args):
+            self.spawned.append(args)
+            return self.original_spawn(args)
+        oraide._spawn = counting_spawn
+
+    def test_quote(self):
+        self.assertEqual(u"'it'\\''s'", control.quote(u"it's"))
+
+    def test_commands_use_connection(self):
+        control.connect(self.server.socket_name)
+
+        for key in u"it's":
+            self.session.send_literal_char(key)
+        contents = capture_pane(self.session.session,
+                                socket_name=self.server.socket_name)
+
+        self.assertEqual([], self.spawned)
+        self.assertIn(b"it's", contents)
+
+    def test_errors_are_translated(self):
+        control.connect(self.server.socket_name)
+
+        with self.assertRaises(SessionNotFoundError):
+            send_keys('missing', 'x', socket_name=self.server.socket_name)
+
+    def test_multiline_keys_fall_back_to_tmux_client(self):
+        control.connect(self.server.socket_name)
+
+        self.session.send_keys(u'a\nb')
+
+        self.assertEqual(1, len(self.spawned))
+
+    def test_lost_connection_falls_back_to_tmux_client(self):
+        client = control.connect(self.server.socket_name)
+        self.server.kill()
+        client._reader.join(2.0)
+
+        self.assertTrue(client.closed)
+        self.assertNotIn(self.server.socket_name, oraide._control_clients)
+        with self.assertRaises(ConnectionFailedError):
+            self.session.send_keys(u'x')
+
+    def test_no_server(self):
+        with self.assertRaises(ConnectionFailedError):
+            control.connect('oraide-test-no-such-server')
+
+    def tearDown(self):
+        oraide._spawn = self.original_spawn
+        control.disconnect(self.server.socket_name)
+        self.server.kill()
+        server_health(self.server.socket_name).reset()
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.server = PrivateServer(2)
+        self.server.start()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'oraide.sock')
+        self.daemon = Daemon(self.path, socket_name=self.server.socket_name)
+        self.thread = threading.Thread(target=self.daemon.serve_forever)
+        self.thread.start()
+
+    def contents(self, session):
+        return capture_pane(session, socket_name=self.server.socket_name)
+
+    def test_job_events(self):
+        session = self.server.sessions[0]
+        events = list(submit(self.path, session, [
+            {'op': 'teletype', 'args': ['hello'], 'kwargs': {'delay': 10}},
+            {'op': 'sleep', 'args': [0.01]},
+            {'op': 'checkpoint'},
+        ], job_id=3))
+
+        self.assertEqual(['queued', 'started', 'step', 'step', 'step',
+                          'done'], [event['event'] for event in events])
+        self.assertEqual(set([3]), set(event['id'] for event in events))
+        self.assertEqual(1, events[-2]['result'])
+        self.assertIn(b'hello', self.contents(session))
+
+    def test_jobs_for_one_session_are_queued(self):
+        session = self.server.sessions[0]
+        results = []
+
+        def run(text):
+            results.append(list(submit(self.path, session, [
+                {'op': 'send_keys', 'args': [text]},
+                {'op': 'sleep', 'args': [0.05]},
+            ])))
+
+        threads = [threading.Thread(target=run, args=(text,))
+                   for text in ('one', 'two')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(set([0, 1]), set(events[0]['position']
+                                          for events in results))
+
+    def test_failed_step(self):
+        with self.assertRaises(RuntimeError):
+            list(submit(self.path, self.server.sessions[0],
+                        [{'op': 'reboot'}]))
+        with self.assertRaises(RuntimeError):
+            list(submit(self.path, 'missing', [{'op': 'send_keys',
+                                                'args': ['x']}]))
+
+    def test_cancel_job(self):
+        session = self.server.sessions[0]
+        events = []
+
+        def run():
+            with self.assertRaises(RuntimeError):
+                for event in submit(self.path, session, [
+                        {'op': 'sleep', 'args': [5]},
+                        {'op': 'send_keys', 'args': ['x']}]):
+                    events.append(event)
+        thread = threading.Thread(target=run)
+        thread.start()
+        deadline = time.time() + 2
+        while not events[1:] and time.time() < deadline:
+            time.sleep(0.01)
+
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(self.path)
+        try:
+            request = {'op': 'cancel', 'session': session}
+            client.sendall((json.dumps(request) + '\n').encode('utf-8'))
+            reply = client.makefile('rb').readline()
+        finally:
+            client.close()
+        thread.join(2.0)
+
+        self.assertEqual('ok', json.loads(reply.decode('utf-8'))['event'])
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(['queued', 'started', 'error'],
+                         [event['event'] for event in events])
+        self.assertEqual('Cancelled', events[-1]['type'])
+
+    def test_ping(self):
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(self.path)
+        try:
+            client.sendall(b'{"op": "ping"}\n')
+            reply = client.makefile('rb').readline()
+        finally:
+            client.close()
+
+        self.assertEqual({'event': 'pong'}, json.loads(reply.decode('utf-8')))
+
+    def test_invalid_requests(self):
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(self.path)
+        try:
+            client.sendall(b'[]\n"x"\n1\n{"op": "run", "id": 4, '
+                           b'"session": "x", "steps": "ls"}\n'
+                           b'{"op": "ping"}\n')
+            replies = client.makefile('rb')
+            events = [json.loads(replies.readline().decode('utf-8'))
+                      for _ in range(5)]
+        finally:
+            client.close()
+
+        self.assertEqual(['error'] * 4 + ['pong'],
+                         [event['event'] for event in events])
+        self.assertEqual(4, events[3]['id'])
+
+    def tearDown(self):
+        self.daemon.shutdown()
+        self.thread.join()
+        self.server.kill()
+        server_health(self.server.socket_name).reset()
+        shutil.rmtree(self.directory)
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'demo.journal')
+        self.sent = []
+        self.original_tmux = oraide._tmux
+        oraide._tmux = lambda args, *rest, **kwargs: self.sent.append(args)
+
+    def test_sends_are_recorded(self):
+        s = Session('demo', enable_auto_advance=True, socket_name='sock')
+        journal.start(self.path)
+        s.teletype(u'h\xe9', delay=0)
+        send_keys('other', 'Enter', literal=False)
+        journal.stop()
+
+        entries = list(journal.read(self.path))
+        self.assertEqual([(u'sock', u'demo', u'h', True),
+                          (u'sock', u'demo', u'\xe9', True),
+                          (None, u'other', u'Enter', False)],
+                         [entry[1:] for entry in entries])
+        times = [entry.time for entry in entries]
+        self.assertEqual(sorted(times), times)
+
+    def test_nothing_recorded_when_stopped(self):
+        journal.start(self.path)
+        journal.stop()
+        send_keys('demo', 'a')
+
+        self.assertEqual([], list(journal.read(self.path)))
+
+    def test_failed_sends_are_not_recorded(self):
+        def fail(args, *rest, **kwargs):
+            raise CircuitOpenError(1, ' '.join(args), b'')
+        oraide._tmux = fail
+        journal.start(self.path)
+        with self.assertRaises(CircuitOpenError):
+            Session('demo').send_literal_char('a')
+        journal.stop()
+
+        self.assertEqual([], list(journal.read(self.path)))
+
+    def test_retried_send_is_recorded_once(self):
+        sends = []
+
+        def fail_first_try(args, *rest, **kwargs):
+            if 'send-keys' in args:
+                sends.append(args)
+                if len(sends) % 2:
+                    raise ConnectionFailedError(1, 'send-keys', b'')
+        oraide._tmux = fail_first_try
+        s = Session('demo', restart_command='sh')
+        journal.start(self.path)
+        s.send_literal_char('a')
+        s.send_keys('b')
+        journal.stop()
+
+        self.assertEqual(['a', 'b'], [entry.keys for entry
+                                      in journal.read(self.path)])
+
+    def test_runs_are_appended(self):
+        for text in ('a', 'b'):
+            journal.start(self.path, buffer_size=0)
+            send_keys('demo', text)
+            journal.stop()
+
+        self.assertEqual(['a', 'b'], [entry.keys for entry
+                                      in journal.read(self.path)])
+
+    def test_truncated_record_is_ignored(self):
+        journal.start(self.path)
+        send_keys('demo', 'a')
+        send_keys('demo', 'bcd')
+        journal.stop()
+        with open(self.path, 'rb+') as fp:
+            fp.truncate(os.path.getsize(self.path) - 1)
+
+        self.assertEqual(['a'], [entry.keys for entry
+                                 in journal.read(self.path)])
+
+    def test_replay_keeps_timing(self):
+        with open(self.path, 'wb') as fp:
+            fp.write(journal.MAGIC)
+            for seconds, target, kind, text in [
+                    (0, 0, journal.KIND_START, b''),
+                    (0, 0, journal.KIND_TARGET, b'\0demo'),
+                    (0.0, 0, journal.KIND_LITERAL, b'a'),
+                    (0.2, 0, journal.KIND_KEYS, b'Enter')]:
+                fp.write(journal.RECORD.pack(seconds, target, kind,
+                                             len(text)) + text)
+        sleeps = []
+        original_sleep = oraide._sleep
+        oraide._sleep = sleeps.append
+        try:
+            journal.replay(self.path, session='scratch', speed=2)
+        finally:
+            oraide._sleep = original_sleep
+
+        self.assertEqual(1, len(sleeps))
+        self.assertAlmostEqual(0.1, sleeps[0], places=2)
+        self.assertEqual([['tmux', 'send-keys', '-l', '-tscratch', 'a'],
+                          ['tmux', 'send-keys', '-tscratch', 'Enter']],
+                         self.sent)
+
+    def test_not_a_journal(self):
+        with open(self.path, 'wb') as fp:
+            fp.write(b'hello')
+
+        with self.assertRaises(ValueError):
+            list(journal.read(self.path))
+
+    def tearDown(self):
+        journal.stop()
+        oraide._tmux = self.original_tmux
+        shutil.rmtree(self.directory)
+
+
+class TestKeynames(unittest.TestCase):
+    def test_keynames(self):
+        for key in (keys.enter, 'enter', keys.control('c'), 'x',
+                    keys.alt(keys.f1), 'C--', keys.f20, 'BTab', 'DC', 'IC',
+                    'NPage', 'PPage', 'PgUp', 'PgDn', 'KP*', 'C-KPEnter',
+                    '^a', '^'):
+            self.assertTrue(keys.is_keyname(key), key)
+        for key in ('Entr', 'hello', 'C-', '', 'F21', 'KP'):
+            self.assertFalse(keys.is_keyname(key), key)
+
+
+class TestScript(unittest.TestCase):
+    def setUp(self):
+        self.sleeps = []
+        self.original_sleep = oraide._sleep
+        oraide._sleep = lambda seconds, flow=None: self.sleeps.append(seconds)
+
+    def test_compiled_teletype_matches_session(self):
+        s = RecordingSession('test', enable_auto_advance=True)
+        script = Script(s, seed=1)
+
+        script.enter('ab', after=keys.escape)
+        script.teletype(u'cd e', delay=100, burst=2)
+
+        self.assertEqual([u'a', u'b', keys.escape, u'cd', u' ', u'e'],
+                         [op.value for op in script.ops
+                          if op.kind in ('send', 'keys')])
+        sleeps = [op for op in script.ops if op.kind == 'sleep']
+        self.assertEqual((0.081, 0.099), sleeps[0][3:])
+        self.assertEqual((0.18, 0.22), sleeps[2][3:])
+        for op in sleeps:
+            self.assertTrue(op.shortest <= op.seconds <= op.longest)
+
+    def test_estimate(self):
+        script = Script(RecordingSession('test'), seed=1)
+        script.teletype('abc', delay=100)
+        script.sleep(1)
+
+        estimate = script.estimate(send_seconds=0.01)
+
+        self.assertEqual(1, estimate.waits)
+        self.assertAlmostEqual(1.33, estimate.expected)
+        self.assertAlmostEqual(1.3, estimate.shortest)
+        self.assertAlmostEqual(1.36, estimate.longest)
+        self.assertTrue(estimate.shortest <= estimate.planned <=
+                        estimate.longest)
+
+    def test_same_seed_same_timing(self):
+        scripts = [Script(RecordingSession('test'), seed=7)
+                   for _ in range(2)]
+        for script in scripts:
+            script.teletype('hello world')
+
+        self.assertEqual(scripts[0].ops, scripts[1].ops)
+
+    def test_unknown_key_name(self):
+        script = Script(RecordingSession('test'))
+
+        with self.assertRaises(ValueError):
+            script.send_keys('Entr', literal=False)
+        with self.assertRaises(ValueError):
+            script.enter('ls', after='Retrun')
+        self.assertEqual([], script.ops)
+
+    def test_run(self):
+        s = RecordingSession('test', resume_from=1)
+        script = Script(s, seed=1)
+        with script.auto_advance():
+            script.teletype('ab', delay=10)
+        script.checkpoint()
+        script.enter(teletype=False)
+
+        prompts = []
+        original_input = oraide._input
+        oraide._input = prompts.append
+        try:
+            script.run()
+        finally:
+            oraide._input = original_input
+
+        self.assertEqual([(u'a', True), (u'b', True), (keys.enter, False)],
+                         s.sent)
+        self.assertEqual([], self.sleeps)
+        self.assertEqual([u'[test] Press enter to continue'], prompts)
+        self.assertEqual(1, s.last_checkpoint)
+
+    def tearDown(self):
+        oraide._sleep = self.original_sleep
+
+
+class TestCluster(unittest.TestCase):
+    def setUp(self):
+        self.cluster = Cluster(4, shards=2, command='cat')
+        self.cluster.start()
+
+    def contents(self, session):
+        return capture_pane(session,
+                            socket_name=self.cluster.socket_name(session))
+
+    def test_sessions_are_sharded(self):
+        socket_names = [self.cluster.socket_name(session)
+                        for session in self.cluster.sessions]
+
+        self.assertEqual(2, len(set(socket_names)))
+        self.assertEqual(2, socket_names.count(socket_names[0]))
+
+    def test_run(self):
+        results = self.cluster.run(dict(
+            (session, [{'op': 'teletype', 'args': [session],
+                        'kwargs': {'delay': 10}}])
+            for session in self.cluster.sessions), timeout=10)
+
+        for session, result in results.items():
+            self.assertEqual('done', result.events[-1]['event'])
+            self.assertIn(session.encode('ascii'), self.contents(session))
+
+    def test_errors_are_collected(self):
+        with self.assertRaises(ClusterError) as context:
+            self.cluster.run({
+                'session0': [{'op': 'send_keys', 'args': ['x']}],
+                'session1': [{'op': 'reboot'}],
+            }, timeout=10)
+
+        results = context.exception.results
+        self.assertEqual(None, results['session0'].error)
+        self.assertIn('ValueError', results['session1'].error)
+
+    def test_timeout_is_shared_by_all_jobs(self):
+        start = time.time()
+        with self.assertRaises(ClusterError) as context:
+            self.cluster.run(dict(
+                (session, [{'op': 'sleep', 'args': [2]}])
+                for session in self.cluster.sessions), timeout=0.5)
+
+        self.assertTrue(time.time() - start < 1.5)
+        self.assertEqual(['timed out'] * 4,
+                         [result.error for result
+                          in context.exception.results.values()])
+
+    def test_unknown_session(self):
+        with self.assertRaises(ValueError):
+            self.cluster.submit('missing', [])
+
+    def test_sessions_are_required(self):
+        with self.assertRaises(ValueError):
+            Cluster([])
+
+    def test_sessions_from_a_generator(self):
+        cluster = Cluster(('lab{}'.format(i) for i in range(3)), shards=8)
+
+        self.assertEqual(['lab0', 'lab1', 'lab2'], cluster.sessions)
+        self.assertEqual(3, len(cluster.servers))
+
+    def test_lost_shard_fails_its_jobs(self):
+        result = self.cluster.submit('session0', [{'op': 'sleep',
+                                                   'args': [5]}])
+        self.cluster._processes[result.shard].terminate()
+
+        self.assertTrue(result.wait(5))
+        self.assertIn('ShardLost', result.error)
+
+    def tearDown(self):
+        self.cluster.stop()
+
+
+class TestRemote(unittest.TestCase):
+    def setUp(self):
+        self.server = PrivateServer(1, command='cat')
+        self.server.start()
+        self.agent = Agent(port=0, token='secret')
+        self.thread = threading.Thread(target=self.agent.serve_forever)
+        self.thread.start()
+        self.node = Node('127.0.0.1', self.agent.port, token='secret')
+        self.session = RemoteSession(
+            '127.0.0.1:{}'.format(self.server.sessions[0]),
+            node=self.node, socket_name=self.server.socket_name,
+            enable_auto_advance=True)
+
+    def test_teletype_and_screen(self):
+        self.session.teletype(u'h\xe9llo', delay=1)
+        self.session.flush()
+
+        lines = [line for _, line in self.session.screen()]
+        self.assertIn(u'h\xe9llo', lines[0])
+        self.assertEqual('127.0.0.1', self.session.host)
+
+    def test_errors_are_raised_later(self):
+        missing = RemoteSession('127.0.0.1:missing', node=self.node,
+                                socket_name=self.server.socket_name)
+
+        missing.send_keys(u'x')
+        with self.assertRaises(SessionNotFoundError):
+            missing.flush()
+        missing.flush()
+
+    def test_agent_teletype(self):
+        self.node.call('teletype', session=self.server.sessions[0],
+                       socket_name=self.server.socket_name, keys=u'abc',
+                       delay=1)
+
+        self.assertIn(b'abc', capture_pane(
+            self.server.sessions[0], socket_name=self.server.socket_name))
+
+    def test_bad_token(self):
+        with self.assertRaises(RemoteError):
+            Node('127.0.0.1', self.agent.port, token='wrong')
+
+    def test_agent_requires_token(self):
+        token = os.environ.pop('ORAIDE_AGENT_TOKEN', None)
+        try:
+            with self.assertRaises(ValueError):
+                Agent(port=0)
+        finally:
+            if token is not None:
+                os.environ['ORAIDE_AGENT_TOKEN'] = token
+
+    def test_missing_token(self):
+        with self.assertRaises(RemoteError):
+            Node('127.0.0.1', self.agent.port, token='')
+
+    def test_invalid_requests(self):
+        client = socket.create_connection(('127.0.0.1', self.agent.port))
+        try:
+            client.sendall(b'{"op": "hello", "token": "secret"}\n'
+                           b'[]\n1\n{"op": "ping", "id": 3}\n')
+            replies = client.makefile('rb')
+            replies = [json.loads(replies.readline().decode('utf-8'))
+                       for _ in range(4)]
+        finally:
+            client.close()
+
+        self.assertEqual([True, False, False, True],
+                         [reply['ok'] for reply in replies])
+        self.assertEqual('ValueError', replies[1]['type'])
+        self.assertEqual(3, replies[3]['id'])
+
+    def test_token_must_be_a_string(self):
+        client = socket.create_connection(('127.0.0.1', self.agent.port))
+        try:
+            client.sendall(b'{"op": "hello", "token": 1}\n')
+            reply = json.loads(client.makefile('rb').readline().decode(
+                'utf-8'))
+        finally:
+            client.close()
+
+        self.assertEqual('authentication failed', reply['message'])
+
+    def test_output_is_not_available(self):
+        with self.assertRaises(RemoteError):
+            self.session.output()
+
+    def test_lost_connection(self):
+        self.agent.shutdown()
+        self.thread.join()
+        self.node._sock.shutdown(socket.SHUT_RDWR)
+        self.node._reader.join(2.0)
+
+        with self.assertRaises(RemoteError):
+            self.session.send_keys(u'x')
+
+    def test_coalesce(self):
+        def send(session, keys, literal=True):
+            return ({'op': 'send_keys', 'session': session, 'keys': keys,
+                     'literal': literal, 'socket_name': None}, keys)
+
+        merged = _coalesce([send('a', 'h'), send('a', 'i'),
+                            send('a', 'Enter', literal=False),
+                            send('b', 'x'), send('a', 'y')])
+
+        self.assertEqual([('hi', ['h', 'i']), ('Enter', ['Enter']),
+                          ('x', ['x']), ('y', ['y'])],
+                         [(request['keys'], calls)
+                          for request, calls in merged])
+
+    def tearDown(self):
+        if not self.node.closed:
+            self.node.close()
+        self.agent.shutdown()
+        self.thread.join()
+        self.server.kill()
+        server_health(self.server.socket_name).reset()
@@ -0,0 +1,216 @@
+"""This module schedules steps across several sessions at once, so that one
+pane's typing doesn't stall the others. For example, to start a server in one
+pane and query it from another, one second after the server starts:
+
+.. code-block:: python
+
+   from oraide import Session
+   from oraide.timeline import Timeline
+
+   server = Session('server', enable_auto_advance=True)
+   client = Session('client', enable_auto_advance=True)
+
+   timeline = Timeline()
+   started = timeline.add(server.enter, args=['python -m SimpleHTTPServer'])
+   timeline.add(client.enter, args=['curl localhost:8000'], start=1.0,
+                requires=[started])
+   timeline.add(client.teletype, args=['# meanwhile...'], start=0.5)
+   timeline.run()
+
+Steps for the same session run one at a time, in the order they were
+scheduled. Steps for different sessions run concurrently, each session on its
+own worker thread. Steps that become due at the same moment are always
+dispatched in the order they were added to the timeline.
+"""
+
+import heapq
+import logging
+import threading
+import time
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+logger = logging.getLogger(__name__)
+
+_clock = getattr(time, 'monotonic', time.time)
+
+
+class Step(object):
+    """A single scheduled call on a :class:`Timeline`. Steps are created with
+    :meth:`Timeline.add`; don't create them directly.
+
+    After the timeline runs, ``started`` and ``finished`` hold the times (in
+    seconds since the timeline started) at which the step began and ended.
+    """
+
+    def __init__(self, index, func, args, kwargs, start, requires, name,
+                 session):
+        self.index = index
+        self.func = func
+        self.args = tuple(args)
+        self.kwargs = dict(kwargs)
+        self.start = start
+        self.requires = tuple(requires)
+        self.name = name
+        self.session = session
+        self.started = None
+        self.finished = None
+
+    def __repr__(self):
+        return '<Step {} {}>'.format(self.index, self.name)
+
+
+class Timeline(object):
+    """A set of steps for one or more sessions, with relative start times and
+    dependencies between steps.
+
+    :param clock: a function returning the current time in seconds (for
+        overriding the default monotonic clock)
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock if clock is not None else _clock
+        self.steps = []
+
+    def add(self, func, args=(), kwargs=None, start=0, requires=(),
+            name=None, session=None):
+        """Schedule a call to ``func`` and return its :class:`Step`.
+
+        The step starts ``start`` seconds after all of the steps in
+        ``requires`` have finished or, if there are no required steps,
+        ``start`` seconds after the timeline begins.
+
+        :param func: the function to call, typically a bound method of a
+            :class:`oraide.Session`, such as ``session.enter`` (which runs
+            with auto-advance enabled; see :meth:`run`)
+        :param args: positional arguments for ``func``
+        :param kwargs: keyword arguments for ``func``
+        :param start: the delay, in seconds, before the step begins
+        :param requires: steps (previously returned by this method) that must
+            finish before this step starts
+        :param name: a name for the step, for logging (defaults to the name of
+            ``func``)
+        :param session: the name of the session that ``func`` acts on (by
+            default, the session of a bound :class:`oraide.Session` method;
+            otherwise, the step runs on its own)
+        """
+        for required in requires:
+            if required not in self.steps:
+                raise ValueError(
+                    '{!r} is not a step of this timeline'.format(required))
+
+        if session is None:
+            session = getattr(getattr(func, '__self__', None), 'session', None)
+        if name is None:
+            name = getattr(func, '__name__', repr(func))
+
+        step = Step(len(self.steps), func, args, kwargs or {}, start,
+                    requires, name, session)
+        self.steps.append(step)
+        return step
+
+    def run(self):
+        """Run every step, returning once all of them have finished.
+
+        Steps that are bound methods of a :class:`oraide.Session` run inside
+        the session's :meth:`~oraide.Session.auto_advance`, so they never stop
+        to prompt the presenter: with several sessions typing at once, a
+        prompt would be ambiguous.
+
+        If a step raises an exception, no further steps are started. Steps
+        already in progress are allowed to finish, then the exception of the
+        earliest failed step is raised.
+        """
+        dependents = dict((step, []) for step in self.steps)
+        waiting_on = {}
+        for step in self.steps:
+            waiting_on[step] = len(step.requires)
+            for required in step.requires:
+                dependents[required].append(step)
+
+        due = []
+        for step in self.steps:
+            if not step.requires:
+                heapq.heappush(due, (step.start, step.index, step))
+
+        results = queue.Queue()
+        lanes = {}
+        running = 0
+        failures = []
+        origin = self._origin = self.clock()
+
+        try:
+            while due or running:
+                now = self.clock() - origin
+                while due and due[0][0] <= now and not failures:
+                    step = heapq.heappop(due)[2]
+                    self._lane(lanes, step, results).put(step)
+                    running += 1
+
+                if not running and (failures or not due):
+                    break
+
+                timeout = None
+                if due and not failures:
+                    timeout = max(due[0][0] - (self.clock() - origin), 0)
+                try:
+                    step, exc = results.get(timeout=timeout)
+                except queue.Empty:
+                    continue
+
+                running -= 1
+                if exc is not None:
+                    failures.append((step.index, exc))
+                    continue
+
+                for dependent in dependents[step]:
+                    waiting_on[dependent] -= 1
+                    if not waiting_on[dependent]:
+                        ready = max(req.finished for req in dependent.requires)
+                        heapq.heappush(due, (ready + dependent.start,
+                                             dependent.index, dependent))
+        finally:
+            for lane in lanes.values():
+                lane.put(None)
+
+        if failures:
+            raise min(failures, key=lambda failure: failure[0])[1]
+
+    def _lane(self, lanes, step, results):
+        key = step.session if step.session is not None else step
+        if key not in lanes:
+            lane = queue.Queue()
+            worker = threading.Thread(target=self._work,
+                                      args=(lane, results))
+            worker.daemon = True
+            worker.start()
+            lanes[key] = lane
+        return lanes[key]
+
+    def _work(self, lane, results):
+        for step in iter(lane.get, None):
+            step.started = self.clock() - self._origin
+            logger.info('[%s] Starting step %s', step.session, step.name)
+            try:
+                self._call(step)
+            except BaseException as exc:
+                # even SystemExit must be reported, or run() waits forever
+                error = exc
+            else:
+                error = None
+            step.finished = self.clock() - self._origin
+            results.put((step, error))
+
+    def _call(self, step):
+        session = getattr(step.func, '__self__', None)
+        auto_advance = getattr(session, 'auto_advance', None)
+        if auto_advance is not None:
+            with auto_advance():
+                return step.func(*step.args, **step.kwargs)
+        return step.func(*step.args, **step.kwargs)
+
+
+__all__ = ['Step', 'Timeline']
@@ -1,4 +1,6 @@
 import os
+import re
+import threading
 import time
 
 from invoke import run, task
@@ -10,47 +12,147 @@ DOCS_ROOT = os.path.abspath(os.path.join(
     os.path.dirname(os.path.dirname(__file__)),
     'docs')
 )
+PROJECT_ROOT = os.path.dirname(DOCS_ROOT)
+
+AUTODOC_PATTERN = re.compile(r'^\s*\.\. auto\w+:: ([\w.]+)', re.MULTILINE)
+MODULE_PATTERN = re.compile(r'^\s*\.\. (?:current)?module:: ([\w.]+)',
+                            re.MULTILINE)
+
+
+def module_name(path):
+    """Get the dotted module name of a Python file in the project."""
+    relative = os.path.relpath(os.path.abspath(path), PROJECT_ROOT)
+    parts = os.path.splitext(relative)[0].split(os.sep)
+    if parts[-1] == '__init__':
+        parts.pop()
+    return '.'.join(parts)
+
+
+def pages_documenting(module, docs_root=DOCS_ROOT):
+    """Find the reST pages with autodoc directives for ``module``."""
+    pages = []
+    for dirpath, dirnames, filenames in os.walk(docs_root):
+        dirnames[:] = [d for d in dirnames if not d.startswith('_')]
+        for filename in filenames:
+            if not filename.endswith('.rst'):
+                continue
+            path = os.path.join(dirpath, filename)
+            with open(path) as fp:
+                text = fp.read()
+
+            targets = AUTODOC_PATTERN.findall(text)
+            if not targets:
+                continue
+            current_modules = MODULE_PATTERN.findall(text)
+            if (module in current_modules or
+                    any(target == module or target.startswith(module + '.')
+                        for target in targets)):
+                pages.append(path)
+    return pages
+
+
+class DebouncedBuilder(object):
+    """Coalesce bursts of file system events into a single build.
+
+    Each call to :meth:`request` restarts a timer; the build runs once no
+    requests have arrived for ``delay`` seconds. Only one build runs at a
+    time. A request that arrives during a build sets a pending flag, and
+    another build follows as soon as the current one finishes.
+    """
+    def __init__(self, build, delay=0.5):
+        self.build = build
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.timer = None
+        self.building = False
+        self.pending = False
+        self.changed = set()
+
+    def request(self, path=None):
+        with self.lock:
+            if path is not None:
+                self.changed.add(path)
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.delay, self._fire)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _fire(self):
+        with self.lock:
+            self.timer = None
+            if self.building:
+                self.pending = True
+                return
+            self.building = True
+
+        try:
+            while True:
+                with self.lock:
+                    changed, self.changed = self.changed, set()
+                    self.pending = False
+                self.build(changed)
+                with self.lock:
+                    if not self.pending:
+                        break
+        finally:
+            with self.lock:
+                self.building = False
 
 
 class TouchFileEventHandler(PatternMatchingEventHandler):
-    """Event handler """
+    """Event handler that invalidates the pages documenting changed modules,
+    so that Sphinx's incremental build picks them up."""
     def __init__(self, *args, **kwargs):
-        self.touch_file = kwargs.pop('touch_file', None)
+        self.builder = kwargs.pop('builder', None)
         super(TouchFileEventHandler, self).__init__(*args, **kwargs)
 
     def on_any_event(self, event):
-        with open(self.touch_file, 'a') as fp:
-            os.utime(fp.name, None)
+        if event.is_directory:
+            return
+        for page in pages_documenting(module_name(event.src_path)):
+            os.utime(page, None)
+        self.builder.request(event.src_path)
 
 
 class MakeEventHandler(PatternMatchingEventHandler):
     def __init__(self, *args, **kwargs):
-        self.make_target = kwargs.pop('make_target', None)
-        self.after = kwargs.pop('after', None)
+        self.builder = kwargs.pop('builder', None)
         super(MakeEventHandler, self).__init__(*args, **kwargs)
 
     def on_any_event(self, event):
-        run('cd {docs_root} && make {target}'.format(docs_root=DOCS_ROOT,
-                                                     target=self.make_target))
+        if event.is_directory:
+            return
+        self.builder.request(event.src_path)
 
-        if self.after:
-            run(self.after)
+
+def make(target, after=None):
+    """Return a build function that runs a docs make target (which uses
+    Sphinx's incremental build), then an optional command."""
+    def build(changed):
+        run('cd {docs_root} && make {target}'.format(docs_root=DOCS_ROOT,
+                                                     target=target))
+        if after:
+            run(after)
+    return build
 
 
 @task
-def watch(after=None):
+def watch(after=None, delay=0.5):
+    builder = DebouncedBuilder(make('html', after=after), delay=float(delay))
+
     py_event_handler = TouchFileEventHandler(
         patterns=['*.py'],
-        touch_file='index.rst'
+        builder=builder,
     )
     rst_event_handler = MakeEventHandler(
         patterns=['*.rst'],
-        make_target='html',
-        after=after)
+        builder=builder,
+    )
 
     observer = Observer()
-    observer.schedule(py_event_handler, path='..', recursive=True)
-    observer.schedule(rst_event_handler, path='.', recursive=True)
+    observer.schedule(py_event_handler, path=PROJECT_ROOT, recursive=True)
+    observer.schedule(rst_event_handler, path=DOCS_ROOT, recursive=True)
 
     observer.start()
     try: